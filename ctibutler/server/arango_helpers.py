@@ -1,13 +1,16 @@
+import base64
 import contextlib
-from types import SimpleNamespace
+import json
 import typing
+import uuid
 from django.conf import settings
-from ctibutler.server.utils import Pagination, Response
+from django.http import StreamingHttpResponse
+from ctibutler.server.utils import ArangoPagination, Pagination, Response
 from drf_spectacular.utils import OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from dogesec_commons.objects.helpers import ArangoDBHelper as DSC_ArangoDBHelper
 from rest_framework import exceptions
-from ctibutler.server import utils
+from ctibutler.server import utils, vector_search
 from arango.database import StandardDatabase
 if typing.TYPE_CHECKING:
     from .. import settings
@@ -160,6 +163,9 @@ SEMANTIC_SEARCH_SORT_FIELDS = [
     "type_ascending",
     "type_descending",
 ]
+# only for /search with `text`, ranks the matches with BM25
+RELEVANCE_SORT = "relevance_descending"
+SEMANTIC_SEARCH_SORT_FIELDS_WITH_RELEVANCE = SEMANTIC_SEARCH_SORT_FIELDS + [RELEVANCE_SORT]
 KNOWLEDGE_BASE_TO_COLLECTION_MAPPING = {
     "mitre-f3": [
         "mitre_f3_vertex_collection",
@@ -204,26 +210,44 @@ COLLECTION_TO_KNOWLEDGE_BASE_MAPPING = {v: k for k, vv in KNOWLEDGE_BASE_TO_COLL
 ATTACK_SORT_FIELDS = CTI_SORT_FIELDS+['attack_id_ascending', 'attack_id_descending']
 
 from functools import lru_cache
-@lru_cache
-def _get_versions(collection, arango_revision):
-    print("checking version: ", arango_revision)
-    helper = ArangoDBHelper(collection, SimpleNamespace(GET=dict(), query_params=SimpleNamespace(dict=dict)))
+from django.core.cache import cache
+
+VERSION_CATALOGUE_CACHE_KEY = 'ctibutler:version-catalogue:{}'
+
+def _get_versions(helper: 'ArangoDBHelper'):
     query = """
         FOR doc IN @@collection
         FILTER STARTS_WITH(doc._stix2arango_note, "version=")
         RETURN DISTINCT doc._stix2arango_note
         """
-    bind_vars = {'@collection': collection}
+    bind_vars = {'@collection': helper.collection}
     versions = helper.execute_query(query, bind_vars=bind_vars, paginate=False)
-    versions = helper.clean_and_sort_versions(versions)
-    return versions
+    return helper.clean_and_sort_versions(versions)
+
+def get_version_catalogue(collection):
+    """
+    Installed versions of a collection (newest first) and the revisions of the collection and its edge collection they were read at.
+
+    Kept in the django cache until an import into the collection finishes (see `invalidate_version_catalogue`) or for `VERSION_CACHE_TTL` seconds,
+    so resolving the latest version does not need a request to ArangoDB.
+    """
+    key = VERSION_CATALOGUE_CACHE_KEY.format(collection)
+    catalogue = cache.get(key)
+    if catalogue is None:
+        helper = ArangoDBHelper(collection, None)
+        revision = helper.db.collection(collection).revision()
+        edge_revision = helper.db.collection(collection.replace('_vertex_collection', '_edge_collection')).revision()
+        catalogue = dict(revision=revision, edge_revision=edge_revision, versions=_get_versions(helper))
+        cache.set(key, catalogue, settings.VERSION_CACHE_TTL)
+    return catalogue
+
+def invalidate_version_catalogue(*collections):
+    collections = collections or COLLECTION_TO_KNOWLEDGE_BASE_MAPPING
+    cache.delete_many([VERSION_CATALOGUE_CACHE_KEY.format(collection) for collection in collections])
 
 def get_versions(collection):
-    #cache for revision
     try:
-        helper = ArangoDBHelper(collection, SimpleNamespace(GET=dict(), query_params=SimpleNamespace(dict=dict)))
-        rev = helper.db.collection(collection).revision()
-        return _get_versions(collection, rev)
+        return get_version_catalogue(collection)['versions']
     except:
         return []
 
@@ -231,6 +255,140 @@ def get_latest_version(collection):
     versions = get_versions(collection) or ['']
     return versions[0]
 
+def get_collection_revisions(collections=None):
+    """
+    `[revision, edge_revision]` of every collection (all knowledgebases by default), `None` for collections that do not exist.
+
+    Read from the version catalogues, so they only change once an import or truncate finishes and normally cost a single cache lookup.
+    """
+    collections = list(collections or COLLECTION_TO_KNOWLEDGE_BASE_MAPPING)
+    cached = cache.get_many([VERSION_CATALOGUE_CACHE_KEY.format(collection) for collection in collections])
+    revisions = []
+    for collection in collections:
+        catalogue = cached.get(VERSION_CATALOGUE_CACHE_KEY.format(collection))
+        if catalogue is None:
+            try:
+                catalogue = get_version_catalogue(collection)
+            except Exception:
+                revisions.append(None)
+                continue
+        revisions.append([catalogue['revision'], catalogue['edge_revision']])
+    return revisions
+
+DATA_GENERATION_CACHE_KEY = 'ctibutler:data-generation'
+
+def get_data_generation_ttl():
+    # without a shared cache the worker's bumps never reach the api processes, so their token expires like the version catalogue does
+    return None if settings.CACHE_REDIS_URL else settings.VERSION_CACHE_TTL
+
+def get_data_generation():
+    """
+    Token replaced by `bump_data_generation` whenever data that the collection revisions do not cover (the bundle memberships, the vector search index) may have changed.
+    """
+    return cache.get_or_set(DATA_GENERATION_CACHE_KEY, uuid.uuid4().hex, get_data_generation_ttl())
+
+def bump_data_generation():
+    cache.set(DATA_GENERATION_CACHE_KEY, uuid.uuid4().hex, get_data_generation_ttl())
+
+def get_data_state():
+    """
+    `get_collection_revisions()` and `get_data_generation()`, changes whenever the data a GET response is read from may have changed.
+    """
+    return [get_collection_revisions(), get_data_generation()]
+
+NAVIGATOR_LAYER_CACHE_KEY = 'ctibutler:navigator-layer:{}:{}:{}:{}:{}:{}:{}'
+
+ATTACK_OBJECT_SUMMARY_KEYS = ['type', 'id', 'name', 'x_mitre_is_subtechnique', 'kill_chain_phases']
+
+@lru_cache(maxsize=8)
+def _get_attack_object_table(collection, mitre_version, arango_revision):
+    helper = ArangoDBHelper(collection, None)
+    query = """
+        FOR doc IN @@collection
+        FILTER doc.type == 'attack-pattern'
+        FILTER @mitre_version ? doc._stix2arango_note == @mitre_version : doc._is_latest
+        SORT doc.modified ASC
+        RETURN KEEP(doc, KEYS(doc, TRUE))
+        """
+    bind_vars = {'@collection': collection, 'mitre_version': mitre_version}
+    table = {}
+    for obj in helper.execute_query(query, bind_vars=bind_vars, paginate=False):
+        if attack_id := (obj.get('external_references') or [{}])[0].get('external_id'):
+            table[attack_id.lower()] = obj
+    return table
+
+def get_attack_object_table(collection, mitre_version):
+    """
+    ATT&CK ID (lowercase) -> technique object for one version of a collection, built once per collection revision.
+    """
+    return _get_attack_object_table(collection, mitre_version, get_version_catalogue(collection)['revision'])
+
+
+BUNDLE_MEMBERSHIP_QUERY = """
+    FOR doc IN @@collection
+    FILTER @stix2arango_note == null OR doc._stix2arango_note == @stix2arango_note
+    LET relationships = (
+        FOR d IN @@view
+        SEARCH d.type == 'relationship' AND ((d._from == doc._id AND d._is_current_from == TRUE) OR (d._to == doc._id AND d._is_current_to == TRUE))
+        RETURN KEEP(d, '_id', '_from', '_to', '_is_ref')
+    )
+    LET direct_ids = UNION_DISTINCT([doc._id], @default_ids, FLATTEN(FOR r IN relationships FILTER r._is_ref != TRUE RETURN [r._id, r._from, r._to]))
+    LET all_ids = UNION_DISTINCT(direct_ids, FLATTEN(FOR r IN relationships RETURN [r._id, r._from, r._to]))
+    // every version of a member is stored, get_materialized_bundle filters them before deduplicating like get_bundle does
+    LET members = (
+        FOR d IN @@view
+        SEARCH d._id IN all_ids
+        RETURN {
+            id: d.id, member: d._id, member_type: d.type, is_ref: d._is_ref == TRUE, direct: d._id IN direct_ids,
+            modified: d.modified, record_modified: d._record_modified
+        }
+    )
+    FOR member IN members
+    INSERT MERGE(member, {object: doc._id, collection: @collection_name, note: doc._stix2arango_note}) INTO @@membership
+"""
+
+def materialize_bundle_memberships(collection, stix2arango_note=None):
+    """
+    Stores the members of the bundle of every object in `collection` (only those of `stix2arango_note` if passed) in `BUNDLE_MEMBERSHIP_COLLECTION`,
+    one document per member, so that `get_bundle` pages through an index instead of searching and deduplicating relationships on every request.
+
+    The bundles of objects change whenever relationships are added, so this runs after every import and arango_cti_processor run.
+    """
+    helper = ArangoDBHelper(collection, None)
+    helper.db.aql.execute(
+        """
+        FOR m IN @@membership
+        FILTER m.collection == @collection_name AND (@stix2arango_note == null OR m.note == @stix2arango_note)
+        REMOVE m IN @@membership
+        """,
+        bind_vars={'@membership': settings.BUNDLE_MEMBERSHIP_COLLECTION, 'collection_name': collection, 'stix2arango_note': stix2arango_note},
+    )
+    helper.db.aql.execute(
+        BUNDLE_MEMBERSHIP_QUERY,
+        bind_vars={
+            '@collection': collection,
+            '@view': settings.VIEW_NAME,
+            '@membership': settings.BUNDLE_MEMBERSHIP_COLLECTION,
+            'collection_name': collection,
+            'stix2arango_note': stix2arango_note,
+            'default_ids': [x for x in ArangoDBHelper.get_default_objects(helper.db) if x.startswith(collection)],
+        },
+    )
+
+def remove_bundle_memberships(*collections):
+    """
+    Removes the bundles of the objects in `collections` and the members stored in them (e.g. after a truncate).
+    """
+    helper = ArangoDBHelper('', None)
+    helper.db.aql.execute(
+        """
+        FOR m IN @@membership
+        FILTER m.collection IN @collections OR PARSE_IDENTIFIER(m.member).collection IN @collections
+        REMOVE m IN @@membership
+        """,
+        bind_vars={'@membership': settings.BUNDLE_MEMBERSHIP_COLLECTION, 'collections': list(collections)},
+    )
+
 class ArangoDBHelper(DSC_ArangoDBHelper):
     max_page_size = settings.MAXIMUM_PAGE_SIZE
     page_size = settings.DEFAULT_PAGE_SIZE
@@ -241,18 +399,45 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         OR ANALYZER(TOKENS(@search_param, "text_en_no_stem_3_10p") ALL IN doc.name, "text_en_no_stem_3_10p") OR ANALYZER(TOKENS(@search_param, "text_en_no_stem_3_10p") ALL IN doc.description, "text_en_no_stem_3_10p")
     )
     """
+    # these fields are linked with the identity analyzer in the view (see populate_dbs.get_semantic_search_properties),
+    # `!=` / `NOT IN` also match documents without the field
+    DEPRECATED_SEARCH_FILTER = 'doc.x_mitre_deprecated != TRUE AND doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]'
+    REVOKED_SEARCH_FILTER = 'doc.revoked != TRUE'
+
+    # set on the latest relationship of each `id` touching an object (see populate_dbs.set_current_relationships), replaces deduplicating at query time
+    CURRENT_FROM_SEARCH_FILTER = '(d._from IN matched_ids AND d._is_current_from == TRUE)'
+    CURRENT_TO_SEARCH_FILTER = '(d._to IN matched_ids AND d._is_current_to == TRUE)'
+
+    sort_expression = None
+    sort_direction = None
+    # set by generic_query when the page continues after a `cursor`
+    cursor_position = None
+
+    def get_sort_stmt(self, sort_options: list[str], customs={}, doc_name="doc"):
+        """
+        Adds `_key` as a tie breaker so that the order is stable between pages,
+        the default `modified DESC, _key DESC` also matches the primary sort of the semantic search view.
+        """
+        sort_stmt = super().get_sort_stmt(sort_options, customs=customs, doc_name=doc_name)
+        if not sort_stmt:
+            return sort_stmt
+        expression, _, direction = sort_stmt.removeprefix("SORT ").rpartition(" ")
+        self.sort_expression, self.sort_direction = expression, direction
+        return f"SORT {expression} {direction}, {doc_name}._key {direction}"
 
     @classmethod
     def get_paginated_response(cls, container,  data, page_number, page_size=page_size, full_count=0):
-        return Response(
-            {
-                "page_size": page_size or cls.page_size,
-                "page_number": page_number,
-                "page_results_count": len(data),
-                "total_results_count": full_count,
-                container: data,
-            }
-        )
+        response = {
+            "page_size": page_size or cls.page_size,
+            "page_number": page_number,
+            "page_results_count": len(data),
+            "total_results_count": full_count,
+            container: data,
+        }
+        if full_count is None:
+            # not counted, see `include_total_count`
+            del response["total_results_count"]
+        return Response(response)
     @classmethod
     def get_paginated_response_schema(cls, container='objects', stix_type='identity'):
         if stix_type == 'string':
@@ -290,6 +475,7 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                         "type": "integer",
                         "example": cls.page_size * cls.max_page_size,
                     },
+                    "next_cursor": ArangoPagination.next_cursor_schema,
                     container: {'type': 'array', 'items': container_schema}
                 }
         }
@@ -337,6 +523,16 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                 type=int,
                 description=Pagination.page_size_query_description,
             ),
+            OpenApiParameter(
+                ArangoPagination.total_count_query_param,
+                type=bool,
+                description=ArangoPagination.total_count_query_description,
+            ),
+            OpenApiParameter(
+                ArangoPagination.cursor_query_param,
+                type=str,
+                description=ArangoPagination.cursor_query_description,
+            ),
         ]
         return parameters
 
@@ -362,16 +558,21 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         """, bind_vars={'@view': settings.VIEW_NAME, 'default_object_ids': default_object_ids}))
         return cls.default_objects
 
-    def execute_query(self, query, bind_vars={}, paginate=True, container=None):
+    def execute_query(self, query, bind_vars={}, paginate=True, container=None, total_count=None):
+        # fullCount makes arango evaluate every match past the LIMIT, only ask for it when it is returned and not counted already
+        full_count = paginate and total_count is None and self.query_as_bool(ArangoPagination.total_count_query_param, True)
         if paginate:
             bind_vars['offset'], bind_vars['count'] = self.get_offset_and_count(self.count, self.page)
-        cursor = self.db.aql.execute(query, bind_vars=bind_vars, count=True, full_count=True)
+        cursor = self.db.aql.execute(query, bind_vars=bind_vars, count=True, full_count=full_count)
         if paginate:
-            return self.get_paginated_response(container or self.container, list(cursor), self.page, self.page_size, cursor.statistics()["fullCount"])
+            if full_count:
+                total_count = cursor.statistics()["fullCount"]
+            return self.get_paginated_response(container or self.container, list(cursor), self.page, self.page_size, total_count)
         return list(cursor)
 
     def get_attack_objects(self, matrix):
         filters = []
+        search_filters = ['doc.type IN @types', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
         types = ATTACK_TYPES
         if new_types := self.query_as_array('types'):
             types = types.intersection(new_types)
@@ -386,42 +587,29 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                 form_list.extend(ATTACK_FORMS.get(form, []))
 
             if form_list:
-                filters.append('FILTER @attack_form_list[? ANY FILTER MATCHES(doc, CURRENT)]')
-                bind_vars['attack_form_list'] = form_list
+                search_filters.append(self.get_forms_search_filter(form_list, bind_vars, 'attack_form'))
 
-        if q := self.query.get(f'attack_version', get_latest_version(collection_name)):
-            bind_vars['mitre_version'] = "version="+q.replace('.', '_').strip('v')
-            filters.append('FILTER doc._stix2arango_note == @mitre_version')
-        else:
-            filters.append('FILTER doc._is_latest')
+        search_filters.append(self.get_version_search_filter('attack_version', collection_name, bind_vars))
 
         if value := self.query_as_array('id'):
             bind_vars['ids'] = value
-            filters.append(
-                "FILTER doc.id in @ids"
-            )
+            search_filters.append("doc.id IN @ids")
 
         if not self.query_as_bool('include_deprecated', False):
-            filters.append('FILTER NOT doc.x_mitre_deprecated AND doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]')
+            search_filters.append(self.DEPRECATED_SEARCH_FILTER)
         if not self.query_as_bool('include_revoked', False):
-            filters.append('FILTER NOT doc.revoked')
+            search_filters.append(self.REVOKED_SEARCH_FILTER)
 
         if value := self.query_as_array('attack_id'):
             bind_vars['attack_ids'] = [v.lower() for v in value]
-            filters.append(
-                "FILTER LOWER(doc.external_references[0].external_id) in @attack_ids"
-            )
+            search_filters.append("doc._ext_id_lc IN @attack_ids")
 
         
         if name := self.query.get('name'):
-            bind_vars['name'] = name.lower()
-            filters.append('FILTER CONTAINS(LOWER(doc.name), @name)')
+            search_filters.append(self.get_wildcard_search_filter(['name'], name, bind_vars, 'name'))
 
         if q := self.query.get('alias'):
-            bind_vars['alias'] = q.lower()
-            filters.append('FILTER APPEND(doc.aliases, doc.x_mitre_aliases)[? ANY FILTER CONTAINS(LOWER(CURRENT), @alias)]')
-
-        search_filters = ['doc.type IN @types', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
+            search_filters.append(self.get_wildcard_search_filter(['aliases', 'x_mitre_aliases'], q, bind_vars, 'alias'))
 
         if q := self.query.get("text"):
             bind_vars['search_param'] = q
@@ -432,13 +620,35 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
 
         return self.generic_query(self.semantic_search_view, search_filters, filters, bind_vars, sort_statement=sort_statement)
 
+    def get_attack_techniques_by_ids(self, matrix, attack_ids, summary=False):
+        collection_name = f'mitre_attack_{matrix}_vertex_collection'
+        mitre_version = self.get_version_param('attack_version', collection_name) or ''
+        table = get_attack_object_table(collection_name, mitre_version)
+        include_deprecated = self.query_as_bool('include_deprecated', False)
+        include_revoked = self.query_as_bool('include_revoked', False)
+
+        objects = []
+        for attack_id in attack_ids:
+            obj = table.get(attack_id.lower())
+            if not obj:
+                continue
+            if (obj.get('x_mitre_deprecated') and not include_deprecated) or (obj.get('revoked') and not include_revoked):
+                continue
+            if summary:
+                obj = dict(
+                    {k: obj[k] for k in ATTACK_OBJECT_SUMMARY_KEYS if k in obj},
+                    attack_id=obj['external_references'][0]['external_id'],
+                )
+            objects.append(obj)
+        return objects
+
     def get_object_by_external_id(self, ext_id: str, version_param, relationship_mode=False, revokable=False, bundle=False, nav_mode=False):
+        if nav_mode:
+            return self.get_nav(ext_id, version_param)
         bind_vars={'@collection': self.collection, 'ext_id': ext_id.lower(), 'keep_values': None}
         filters = ['FILTER doc._stix2arango_note == @mitre_version']
-        mitre_version: str = None
-        if q := self.query.get(version_param, get_latest_version(self.collection)):
-            mitre_version = q
-            bind_vars.update(mitre_version="version="+mitre_version.replace('.', '_').strip('v'))
+        if mitre_version := self.get_version_param(version_param, self.collection):
+            bind_vars.update(mitre_version=mitre_version)
         else:
             filters[0] = 'FILTER doc._is_latest'
 
@@ -447,7 +657,8 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
             bind_vars['include_revoked'] = self.query_as_bool('include_revoked', False)
             filters.append('FILTER (@include_revoked OR NOT doc.revoked) AND (@include_deprecated OR NOT doc.x_mitre_deprecated)')
 
-        main_filter = "FILTER LOWER(doc.external_references[0].external_id) == @ext_id"
+        # `_ext_id_lc` is set at import time and indexed with `_stix2arango_note` (see populate_dbs.setup_external_id_indexes)
+        main_filter = "FILTER doc._ext_id_lc == @ext_id"
         with contextlib.suppress(Exception):
             _, _ = ext_id.split('--')
             main_filter = "FILTER doc.id == @ext_id"
@@ -462,14 +673,9 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         query = query.replace('#main_filter', main_filter).replace('#filters', '\n'.join(filters))
         if bundle or relationship_mode:
             bind_vars.update(keep_values=['_id', '_stix2arango_note'])
-        if nav_mode:
-            bind_vars.update(keep_values=['_id', 'name', 'external_references', 'id', 'type', '_stix2arango_note'])
         bind_vars.update(offset=0, count=None)
         matches = self.execute_query(query, bind_vars=bind_vars, paginate=False)
 
-        if nav_mode:
-            return self.get_nav(matches)
-
         matches = sorted(matches, key=lambda m: utils.split_mitre_version(m.pop('_stix2arango_note', '=').split("=", 1)[-1]), reverse=True)
         matches = matches[:1]
 
@@ -482,38 +688,27 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
     
     def get_sector_objects(self):
         filters = ['FILTER doc.identity_class == "class"']
+        search_filters = ['doc.type == "identity"', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
         collection_name = 'sector_vertex_collection'
         bind_vars = {
         }
 
-        if q := self.query.get(f'sector_version', get_latest_version(collection_name)):
-            bind_vars['mitre_version'] = "version="+q.replace('.', '_').strip('v')
-            filters.append('FILTER doc._stix2arango_note == @mitre_version')
-        else:
-            filters.append('FILTER doc._is_latest')
+        search_filters.append(self.get_version_search_filter('sector_version', collection_name, bind_vars))
 
         if value := self.query_as_array('id'):
             bind_vars['ids'] = value
-            filters.append(
-                "FILTER doc.id in @ids"
-            )
+            search_filters.append("doc.id IN @ids")
 
         if value := self.query_as_array('sector_id'):
             bind_vars['sector_ids'] = [v.lower() for v in value]
-            filters.append(
-                "FILTER LOWER(doc.external_references[0].external_id) in @sector_ids"
-            )
+            search_filters.append("doc._ext_id_lc IN @sector_ids")
 
         
         if name := self.query.get('name'):
-            bind_vars['name'] = name.lower()
-            filters.append('FILTER CONTAINS(LOWER(doc.name), @name)')
+            search_filters.append(self.get_wildcard_search_filter(['name'], name, bind_vars, 'name'))
 
         if q := self.query.get('alias'):
-            bind_vars['alias'] = q.lower()
-            filters.append('FILTER APPEND(doc.aliases, doc.x_opencti_aliases)[? ANY FILTER CONTAINS(LOWER(CURRENT), @alias)]')
-
-        search_filters = ['doc.type == "identity"', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
+            search_filters.append(self.get_wildcard_search_filter(['aliases', 'x_opencti_aliases'], q, bind_vars, 'alias'))
 
         if q := self.query.get("text"):
             bind_vars['search_param'] = q
@@ -555,6 +750,54 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
             mod['versions'] = self.clean_and_sort_versions(mod['versions'])
         return Response(versions)
 
+    def get_version_param(self, version_param, collection):
+        """
+        Returns the `_stix2arango_note` of the version passed in `version_param`, or of the latest installed version if it is not passed.
+
+        Returns None when `version_param` is passed empty or nothing is installed, callers then filter on `_is_latest`.
+        """
+        if version_param in self.query:
+            version = self.query[version_param]
+        else:
+            version = get_latest_version(collection)
+        if not version:
+            return None
+        return "version="+version.replace('.', '_').strip('v')
+
+    def get_version_search_filter(self, version_param, collection, bind_vars):
+        if mitre_version := self.get_version_param(version_param, collection):
+            bind_vars['mitre_version'] = mitre_version
+            return 'doc._stix2arango_note == @mitre_version'
+        return 'doc._is_latest == TRUE'
+
+    @staticmethod
+    def get_wildcard_search_filter(fields: list[str], value: str, bind_vars, bind_name):
+        """
+        SEARCH equivalent of `FILTER CONTAINS(LOWER(doc.field), @value)` over one or more (array) fields, served by the `ctibutler_wildcard` n-gram index of the view.
+        """
+        value = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        bind_vars[bind_name] = f'%{value}%'
+        matchers = ' OR '.join(f'LIKE(doc.{field}, @{bind_name})' for field in fields)
+        return f'ANALYZER({matchers}, "ctibutler_wildcard")'
+
+    @staticmethod
+    def get_forms_search_filter(form_list: list[dict], bind_vars, bind_prefix):
+        """
+        SEARCH equivalent of `FILTER @form_list[? ANY FILTER MATCHES(doc, CURRENT)]`, a `None` value matches documents without the field.
+        """
+        matchers = []
+        for i, form in enumerate(form_list):
+            conditions = []
+            for key, value in form.items():
+                if value is None:
+                    conditions.append(f'(NOT EXISTS(doc.{key}) OR doc.{key} == null)')
+                else:
+                    bind_name = f'{bind_prefix}_{i}_{key}'
+                    bind_vars[bind_name] = value
+                    conditions.append(f'doc.{key} == @{bind_name}')
+            matchers.append('(' + ' AND '.join(conditions) + ')')
+        return '(' + ' OR '.join(matchers) + ')'
+
     def clean_and_sort_versions(self, versions, replace_underscore=True):
         replace_character = '.' if replace_underscore else '_'
         versions = sorted([
@@ -566,6 +809,7 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
     def get_weakness_or_capec_objects(self, lookup_kwarg, types=CWE_TYPES, more_binds={}, more_filters=[], forms={}):
         version_param = lookup_kwarg.replace('_id', '_version')
         filters = []
+        search_filters = ['doc.type IN @types', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
         if new_types := self.query_as_array('types'):
             types = types.intersection(new_types)
 
@@ -574,24 +818,17 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                 "types": list(types),
                 **more_binds
         }
-        if q := self.query.get(version_param, get_latest_version(self.collection)):
-            bind_vars['mitre_version'] = "version="+q.replace('.', '_').strip('v')
-            filters.append('FILTER doc._stix2arango_note == @mitre_version')
-        else:
-            filters.append('FILTER doc._is_latest')
+        search_filters.append(self.get_version_search_filter(version_param, self.collection, bind_vars))
 
         if value := self.query_as_array('id'):
             bind_vars['ids'] = value
-            filters.append(
-                "FILTER doc.id in @ids"
-            )
+            search_filters.append("doc.id IN @ids")
 
         if name := self.query.get('name'):
-            bind_vars['name'] = name.lower()
-            filters.append('FILTER CONTAINS(LOWER(doc.name), @name)')
+            search_filters.append(self.get_wildcard_search_filter(['name'], name, bind_vars, 'name'))
 
         if not self.query_as_bool('include_deprecated'):
-            filters.append('FILTER doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]')
+            search_filters.append('doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]')
 
         if generic_forms := self.query_as_array(lookup_kwarg.replace('_id', '_type')):
             form_list = []
@@ -599,15 +836,11 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                 form_list.extend(forms.get(form, []))
 
             if form_list:
-                filters.append('FILTER @generic_form_list[? ANY FILTER MATCHES(doc, CURRENT)]')
-                bind_vars['generic_form_list'] = form_list
+                search_filters.append(self.get_forms_search_filter(form_list, bind_vars, 'generic_form'))
 
         if value := self.query_as_array(lookup_kwarg):
             bind_vars['ext_ids'] = [v.lower() for v in value]
-            filters.append(
-                "FILTER LOWER(doc.external_references[0].external_id) in @ext_ids"
-            )
-        search_filters = ['doc.type IN @types', 'ANALYZER(STARTS_WITH(doc._id, @collection_name), "identity")']
+            search_filters.append("doc._ext_id_lc IN @ext_ids")
         bind_vars.update(collection_name=self.collection)
 
         if q := self.query.get("text"):
@@ -664,11 +897,11 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
 
         match self.query.get('relationship_direction'):
             case "source_ref":
-                direction_query = "d._from IN matched_ids"
+                direction_query = self.CURRENT_FROM_SEARCH_FILTER
             case 'target_ref':
-                direction_query = 'd._to IN matched_ids'
+                direction_query = self.CURRENT_TO_SEARCH_FILTER
             case _:
-                direction_query = 'd._from IN matched_ids OR d._to IN matched_ids'
+                direction_query = f'{self.CURRENT_FROM_SEARCH_FILTER} OR {self.CURRENT_TO_SEARCH_FILTER}'
 
         if self.query_as_bool('include_embedded_refs', True):
             embedded_refs_query = ''
@@ -680,7 +913,7 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         FOR d IN @@view
         SEARCH d.type == 'relationship' AND (#direction_query) #include_embedded_refs
         #other_filters
-        COLLECT id = d.id INTO docs LET d = FIRST(FOR dd IN docs[*].d SORT dd.modified DESC, dd._record_modified DESC LIMIT 1 RETURN dd) // dedeuplicate across multiple actip runs
+        SORT d.id
         LIMIT @offset, @count
         RETURN KEEP(d, KEYS(d, TRUE))
         """ \
@@ -690,44 +923,109 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
 
         return self.execute_query(new_query, bind_vars=binds, container='relationships')
 
-    def get_nav(self, matches):
-        binds = {
+    NAVIGATOR_TYPES = ['tool', 'malware', 'intrusion-set', 'campaign', 'course-of-action', 'x-mitre-asset']
+
+    def get_nav(self, ext_id, version_param):
+        result = self.get_navigator_layers([ext_id], version_param)[0]
+        if result['error']:
+            raise result['error']
+        return Response(result['layer'])
+
+    def get_navigator_layers(self, ext_ids: list[str], version_param):
+        """
+        Navigator layers of many objects, as `[{ext_id, layer, error}]` in the order of `ext_ids`.
+
+        A layer only changes when the collection or its edge collection does, so layers are kept in the django cache keyed by both revisions
+        and the ones missing are built together in a single query.
+        """
+        mitre_version = self.get_version_param(version_param, self.collection)
+        include_revoked = self.query_as_bool('include_revoked', False)
+        include_deprecated = self.query_as_bool('include_deprecated', False)
+        catalogue = get_version_catalogue(self.collection)
+        cache_keys = {
+            ext_id: NAVIGATOR_LAYER_CACHE_KEY.format(
+                self.collection, catalogue['revision'], catalogue['edge_revision'], mitre_version, include_revoked, include_deprecated, ext_id.lower()
+            )
+            for ext_id in ext_ids
+        }
+        cached = cache.get_many(list(cache_keys.values()))
+        missing = [ext_id for ext_id, key in cache_keys.items() if key not in cached]
+        if missing:
+            built = self._build_navigator_layers(missing, mitre_version, include_revoked, include_deprecated)
+            new_entries = {cache_keys[ext_id]: built[ext_id.lower()] for ext_id in missing}
+            cache.set_many(new_entries, settings.NAVIGATOR_CACHE_TTL)
+            cached.update(new_entries)
+
+        results = []
+        for ext_id in ext_ids:
+            layer, error = cached[cache_keys[ext_id]], None
+            if layer is None:
+                error = exceptions.NotFound('not found')
+            elif isinstance(layer, str):
+                # the type of an object that does not have a layer
+                error = exceptions.ParseError(f'object of type `{layer}` not supported')
+            results.append(dict(ext_id=ext_id, layer=None if error else layer, error=error))
+        return results
+
+    def _build_navigator_layers(self, ext_ids, mitre_version, include_revoked, include_deprecated):
+        # one lookup per id kind, so that each compares a single indexed field like get_object_by_external_id does
+        lookup = """
+            FOR ext_id IN #ids
+            LET matches = (
+                FOR doc IN @@collection
+                FILTER #field == ext_id
+                FILTER @mitre_version ? doc._stix2arango_note == @mitre_version : doc._is_latest
+                FILTER (@include_revoked OR NOT doc.revoked) AND (@include_deprecated OR NOT doc.x_mitre_deprecated)
+                RETURN KEEP(doc, '_id', 'name', 'external_references', 'id', 'type', '_stix2arango_note')
+            )
+            RETURN {ext_id, matches}
+        """
+        query = """
+        FOR row IN UNION((#stix_id_lookup), (#ext_id_lookup))
+            LET matches = row.matches
+            LET relationships = FIRST(matches).type IN @navigator_types ? (
+                FOR d IN @@view
+                SEARCH d.type == 'relationship' AND (d._from IN matches[*]._id OR d._to IN matches[*]._id)
+                LET technique_id = CONTAINS(d._from, 'attack-pattern') ? d._from : (CONTAINS(d._to, 'attack-pattern') ? d._to : null)
+                FILTER technique_id
+                RETURN [technique_id, d.description, DOCUMENT(technique_id).external_references[0].external_id]
+            ) : []
+            RETURN {ext_id: row.ext_id, matched_object: FIRST(matches), relationships}
+        """
+        query = query.replace('#stix_id_lookup', lookup.replace('#ids', '@stix_ids').replace('#field', 'doc.id')) \
+            .replace('#ext_id_lookup', lookup.replace('#ids', '@ext_ids').replace('#field', 'doc._ext_id_lc'))
+        lowered = {ext_id.lower() for ext_id in ext_ids}
+        bind_vars = {
+            '@collection': self.collection,
             '@view': settings.VIEW_NAME,
-            'matches': matches
+            'stix_ids': [ext_id for ext_id in lowered if '--' in ext_id],
+            'ext_ids': [ext_id for ext_id in lowered if '--' not in ext_id],
+            'mitre_version': mitre_version,
+            'include_revoked': include_revoked,
+            'include_deprecated': include_deprecated,
+            'navigator_types': self.NAVIGATOR_TYPES,
         }
-        if not matches:
-            raise exceptions.NotFound('not found')
-        matched_object = matches[0]
-        if matched_object['type'] not in ['tool', 'malware', 'intrusion-set', 'campaign', 'course-of-action', 'x-mitre-asset']:
-            raise exceptions.ParseError(f'object of type `{matched_object["type"]}` not supported')
+        layers = {}
+        for row in self.execute_query(query, bind_vars=bind_vars, paginate=False):
+            matched_object = row['matched_object']
+            if not matched_object:
+                layers[row['ext_id']] = None
+            elif matched_object['type'] not in self.NAVIGATOR_TYPES:
+                layers[row['ext_id']] = matched_object['type']
+            else:
+                layers[row['ext_id']] = self.make_navigator_layer(matched_object, row['relationships'])
+        return layers
+
+    def make_navigator_layer(self, matched_object, relationships):
         version = matched_object['_stix2arango_note'].split('=')[-1]
-        new_query = """
-        LET matched_ids = @matches[*]._id
-        FOR d IN @@view
-        SEARCH d.type == 'relationship' AND (d._from IN matched_ids OR d._to IN matched_ids)
-        RETURN [d._from, d._to, d.description]
-        """
-        relationships = self.execute_query(new_query, bind_vars=binds, paginate=False)
         techniques = {}
-        for obj in relationships:
-            stix_id = None
-            if 'attack-pattern' in obj[0]:
-                stix_id = obj[0]
-            elif "attack-pattern" in obj[1]:
-                stix_id = obj[1]
-            if stix_id:
-                techniques[stix_id] = {
-                    "comment": obj[2],
-                    "score": 100,
-                    "showSubtechniques": True,
-                }
-        final_query = """
-        FOR d IN @@view
-        SEARCH d._id IN @technique_stix_ids
-        RETURN [d._id, d.external_references[0].external_id]
-        """
-        for stix_id, ext_id in self.execute_query(final_query, bind_vars={'@view': settings.VIEW_NAME, 'technique_stix_ids': list(techniques)}, paginate=False):
-            techniques[stix_id].update(techniqueID=ext_id)
+        for stix_id, description, technique_ext_id in relationships:
+            techniques[stix_id] = {
+                "comment": description,
+                "score": 100,
+                "showSubtechniques": True,
+                "techniqueID": technique_ext_id,
+            }
 
         name = matched_object['name']
         attack_id = ''
@@ -775,7 +1073,7 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
                 }
             }
 
-        return Response(nav_retval)
+        return nav_retval
 
     def get_bundle(self, matches):
         binds = {
@@ -787,6 +1085,11 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         if not matches:
             raise exceptions.NotFound({'error': 'No such object'})
 
+        resp = self.get_materialized_bundle(matches[0]['_id'])
+        if resp.data[self.container]:
+            return resp
+        # not materialized yet (see tasks.backfill_bundles), or nothing on this page which the live query confirms
+
         if not self.query_as_bool('include_embedded_refs', True):
             more_search_filters.append('d._is_ref != TRUE')
 
@@ -803,8 +1106,7 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
     LET matched_ids = @matches[*]._id
 
     LET bundle_ids = FLATTEN(
-        FOR d IN @@view SEARCH d.type == 'relationship' AND (d._from IN matched_ids OR d._to IN matched_ids) #more_search_filters
-        COLLECT id = d.id INTO docs LET d = FIRST(FOR dd IN docs[*].d SORT dd.modified DESC, dd._record_modified DESC LIMIT 1 RETURN dd) // dedeuplicate across multiple actip runs
+        FOR d IN @@view SEARCH d.type == 'relationship' AND (#current_relationships) #more_search_filters
         RETURN [d._id, d._from, d._to]
     ) 
     
@@ -815,11 +1117,101 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
     RETURN KEEP(d, KEYS(d, TRUE))
 '''
         query = query \
+                    .replace('#current_relationships', f'{self.CURRENT_FROM_SEARCH_FILTER} OR {self.CURRENT_TO_SEARCH_FILTER}') \
                     .replace('#more_search_filters', "" if not more_search_filters else f" AND {' and '.join(more_search_filters)}") \
                     .replace('#late_filters', '\n'.join(late_filters))
         return self.execute_query(query, bind_vars=binds)
 
+    def get_materialized_bundle(self, object_id):
+        """
+        Same response as `get_bundle`, read from the members stored by `materialize_bundle_memberships`, it has no objects if the bundle is not materialized.
+        """
+        binds = {
+            '@membership': settings.BUNDLE_MEMBERSHIP_COLLECTION,
+            'object_id': object_id,
+        }
+        filters = []
+        if not self.query_as_bool('include_embedded_refs', True):
+            filters.append('FILTER m.direct')
+
+        if not self.query_as_bool('include_embedded_sros', False):
+            filters.append('FILTER NOT m.is_ref')
+
+        if types := self.query_as_array('types'):
+            filters.append('FILTER m.member_type IN @types')
+            binds['types'] = types
+
+        query = """
+        FOR m IN @@membership
+        FILTER m.object == @object_id
+        #filters
+        COLLECT id = m.id INTO members = m LET m = FIRST(FOR mm IN members SORT mm.modified DESC, mm.record_modified DESC LIMIT 1 RETURN mm)
+        LIMIT @offset, @count
+        LET d = DOCUMENT(m.member)
+        RETURN KEEP(d, KEYS(d, TRUE))
+        """.replace('#filters', '\n'.join(filters))
+        return self.execute_query(query, bind_vars=binds)
+
+    EXPORT_FORMATS = ['ndjson', 'bundle']
+
+    def export_objects(self, version_param, collection_name, export_format='ndjson'):
+        """
+        Streams every object of one version of a knowledgebase (`{collection_name}_vertex_collection` then `{collection_name}_edge_collection`).
+
+        The objects are read with a stream cursor, so memory is bounded by `EXPORT_BATCH_SIZE` whatever the size of the version.
+        """
+        if export_format not in self.EXPORT_FORMATS:
+            raise exceptions.ValidationError({'export_format': f"must be one of {self.EXPORT_FORMATS}"})
+        mitre_version = self.get_version_param(version_param, self.collection)
+        installed = ['version='+version.replace('.', '_') for version in get_versions(self.collection)]
+        if mitre_version and mitre_version not in installed:
+            raise exceptions.NotFound({'error': f"version `{self.query.get(version_param)}` is not installed"})
+
+        filters = []
+        if not self.query_as_bool('include_embedded_sros', False):
+            filters.append('FILTER doc._is_ref != TRUE')
+        query = """
+            FOR doc IN @@collection
+            FILTER @mitre_version ? doc._stix2arango_note == @mitre_version : doc._is_latest
+            #more_filters
+            RETURN KEEP(doc, KEYS(doc, TRUE))
+        """.replace('#more_filters', '\n'.join(filters))
+
+        def iter_objects():
+            for suffix in ['vertex', 'edge']:
+                cursor = self.db.aql.execute(
+                    query,
+                    bind_vars={'@collection': f'{collection_name}_{suffix}_collection', 'mitre_version': mitre_version},
+                    stream=True,
+                    batch_size=settings.EXPORT_BATCH_SIZE,
+                    ttl=settings.EXPORT_CURSOR_TTL,
+                )
+                try:
+                    yield from cursor
+                finally:
+                    cursor.close(ignore_missing=True)
+
+        version_name = (mitre_version or 'version=latest').removeprefix('version=')
+        filename = f'{collection_name}-{version_name}'
+        if export_format == 'bundle':
+            bundle_id = 'bundle--' + str(uuid.uuid5(settings.STIX_NAMESPACE, f'{collection_name}+{version_name}'))
+            content = self._stream_bundle(bundle_id, iter_objects())
+            content_type, filename = 'application/json', filename + '.json'
+        else:
+            content = (json.dumps(obj) + '\n' for obj in iter_objects())
+            content_type, filename = 'application/x-ndjson', filename + '.ndjson'
+        return StreamingHttpResponse(content, content_type=content_type, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    @staticmethod
+    def _stream_bundle(bundle_id, objects):
+        yield json.dumps(dict(type='bundle', id=bundle_id))[:-1] + ', "objects": ['
+        for i, obj in enumerate(objects):
+            yield (',\n' if i else '\n') + json.dumps(obj)
+        yield '\n]}\n'
+
     def semantic_search(self):
+        if self.query.get('mode') == 'vector':
+            return self.vector_search()
         binds = {
         }
         search_filters = []
@@ -842,17 +1234,68 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         extra_filters = []
 
         if not self.query_as_bool('include_deprecated', False):
-            extra_filters.append('FILTER doc.x_mitre_deprecated != TRUE AND doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]')
+            search_filters.append(self.DEPRECATED_SEARCH_FILTER)
         if not self.query_as_bool('include_revoked', False):
-            extra_filters.append('FILTER doc.revoked != TRUE')
+            search_filters.append(self.REVOKED_SEARCH_FILTER)
         keep_verb=None
         if show_knowledgebase := self.query_as_bool('show_knowledgebase', False):
             keep_verb = 'KEEP(doc, APPEND(KEYS(doc, TRUE), "_id"))'
-        resp = self.generic_query(self.semantic_search_view, search_filters, extra_filters, binds, return_verb=keep_verb)
+        sort_statement = ''
+        if self.query.get('sort') == RELEVANCE_SORT:
+            if not search_param:
+                raise exceptions.ValidationError({'sort': f"`{RELEVANCE_SORT}` can only be used with `text`"})
+            if self.query.get(ArangoPagination.cursor_query_param):
+                raise exceptions.ValidationError({ArangoPagination.cursor_query_param: f"not supported with `{RELEVANCE_SORT}`, use `page`"})
+            # a single BM25 sort criterion, anything more (e.g. a `_key` tie breaker) stops the view from skipping low scoring documents
+            sort_statement = 'SORT BM25(doc) DESC'
+            keep_verb = f"MERGE({keep_verb or 'KEEP(doc, KEYS(doc, TRUE))'}, {{relevance_score: BM25(doc)}})"
+        resp = self.generic_query(self.semantic_search_view, search_filters, extra_filters, binds, sort_statement=sort_statement, return_verb=keep_verb)
         if show_knowledgebase:
             self.add_knowledgebase_name(resp.data['objects'])
         return resp
 
+    def vector_search(self):
+        """
+        Ranks the latest objects by the similarity of their embedded name and description to `text` (see vector_search.py),
+        the objects are then read from ArangoDB in that order.
+        """
+        text = self.query.get('text')
+        if not text:
+            raise exceptions.ValidationError({'text': "required with `mode=vector`"})
+        if self.query.get('sort') not in [None, RELEVANCE_SORT]:
+            raise exceptions.ValidationError({'sort': f"results of `mode=vector` are always sorted by `{RELEVANCE_SORT}`"})
+        if self.query.get(ArangoPagination.cursor_query_param):
+            raise exceptions.ValidationError({ArangoPagination.cursor_query_param: "not supported with `mode=vector`, use `page`"})
+
+        collections = list(COLLECTION_TO_KNOWLEDGE_BASE_MAPPING)
+        if qq := self.query_as_array('knowledge_bases'):
+            collections = list(dict.fromkeys(c for q in qq for c in KNOWLEDGE_BASE_TO_COLLECTION_MAPPING.get(q, [])))
+        offset, count = self.get_offset_and_count(self.count, self.page)
+        total, hits = vector_search.registry.get().search(
+            text,
+            collections,
+            types=self.query_as_array('types'),
+            include_deprecated=self.query_as_bool('include_deprecated', False),
+            include_revoked=self.query_as_bool('include_revoked', False),
+            limit=offset + count,
+        )
+        keep_verb = 'KEEP(doc, KEYS(doc, TRUE))'
+        if show_knowledgebase := self.query_as_bool('show_knowledgebase', False):
+            keep_verb = 'KEEP(doc, APPEND(KEYS(doc, TRUE), "_id"))'
+        query = f"""
+            FOR hit IN @hits
+            LET doc = DOCUMENT(hit[0])
+            // the index is only rebuilt by the next import, skip objects truncated since
+            FILTER doc != NULL
+            RETURN MERGE({keep_verb}, {{relevance_score: hit[1]}})
+        """
+        objects = self.execute_query(query, bind_vars={'hits': hits[offset:]}, paginate=False)
+        if show_knowledgebase:
+            self.add_knowledgebase_name(objects)
+        if not self.query_as_bool(ArangoPagination.total_count_query_param, True):
+            total = None
+        return self.get_paginated_response(self.container, objects, self.page, self.page_size, total)
+
     def generic_query(self, collection_or_view, search_filters: list[str], extra_filters: list[str], binds, sort_statement='', sort_fields=SEMANTIC_SEARCH_SORT_FIELDS, return_verb=None, use_limit=True):
         search_filters_str = ''
         binds['@collection_or_view'] = collection_or_view
@@ -870,6 +1313,16 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         if not sort_statement:
             sort_statement = self.get_sort_stmt(sort_fields)
 
+        use_cursor = kwargs['paginate'] and sort_statement and self.sort_expression
+        cursor_filters = []
+        if use_cursor:
+            # keyset pagination, every row carries the position it is at in the sort order
+            return_verb = f'{{object: {return_verb}, position: [{self.sort_expression}, doc._key]}}'
+            if position := self.get_cursor_position():
+                binds['cursor_position'] = self.cursor_position = position
+                comparator = '<' if self.sort_direction == 'DESC' else '>'
+                cursor_filters.append(f'FILTER [{self.sort_expression}, doc._key] {comparator} @cursor_position')
+
         query = """
             FOR doc IN @@collection_or_view
             #SEARCH
@@ -880,13 +1333,52 @@ class ArangoDBHelper(DSC_ArangoDBHelper):
         """
         if search_filters:
             search_filters_str = 'SEARCH ' + (' AND '.join(search_filters))
-        query = query.replace('#SEARCH', search_filters_str) \
-            .replace('#FILTER', '\n'.join(extra_filters)) \
+        query = query.replace('#SEARCH', search_filters_str)
+        if cursor_filters and self.query_as_bool(ArangoPagination.total_count_query_param, True):
+            # fullCount would only count the rows after the cursor, count all matches like the first page does
+            count_query = query.replace('#FILTER', '\n'.join(extra_filters)) \
+                .replace('#sort_stmt', '').replace('#LIMIT', 'COLLECT WITH COUNT INTO total_count') \
+                .replace('#return_verb', 'total_count')
+            count_binds = {k: v for k, v in binds.items() if k != 'cursor_position'}
+            kwargs.update(total_count=self.execute_query(count_query, bind_vars=count_binds, paginate=False)[0])
+        query = query.replace('#FILTER', '\n'.join([*extra_filters, *cursor_filters])) \
             .replace('#return_verb', return_verb).replace('#sort_stmt', sort_statement) \
             .replace('#LIMIT', limit_stmt)
         resp = self.execute_query(query, bind_vars=binds, **kwargs)
+        if use_cursor:
+            rows = resp.data[self.container]
+            resp.data[self.container] = [row['object'] for row in rows]
+            resp.data['next_cursor'] = None
+            if rows and len(rows) == self.count:
+                resp.data['next_cursor'] = self.encode_cursor(rows[-1]['position'])
         return resp
 
+    def encode_cursor(self, position):
+        data = json.dumps([self.sort_expression, self.sort_direction, *position])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def get_cursor_position(self):
+        """
+        Decodes the `cursor` query parameter into the [sort value, _key] to continue after, the cursor is only valid for the sort it was made with.
+        """
+        cursor = self.query.get(ArangoPagination.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            sort_expression, sort_direction, value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except Exception:
+            raise exceptions.ValidationError({ArangoPagination.cursor_query_param: "invalid cursor"})
+        if [sort_expression, sort_direction] != [self.sort_expression, self.sort_direction]:
+            raise exceptions.ValidationError({ArangoPagination.cursor_query_param: "cursor was made for a different sort order"})
+        return [value, key]
+
+    def get_offset_and_count(self, count, page):
+        offset, count = super().get_offset_and_count(count, page)
+        if self.cursor_position is not None:
+            # the cursor filter of generic_query already skips everything before this page
+            offset = 0
+        return offset, count
+
     @staticmethod
     def add_knowledgebase_name(objects):
         for obj in objects:
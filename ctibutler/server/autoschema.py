@@ -5,7 +5,14 @@ from drf_spectacular.utils import OpenApiResponse, OpenApiExample
 import uritemplate
 from dogesec_commons.utils.autoschema import CustomAutoSchema
 class CtibutlerAutoSchema(CustomAutoSchema):
-    pass
+    def get_override_parameters(self):
+        """
+        Also adds the parameters a view builds per action (see `TruncateView.get_action_parameters`), for actions shared by views whose parameter names differ.
+        """
+        params = super().get_override_parameters()
+        if get_action_parameters := getattr(self.view, 'get_action_parameters', None):
+            params.extend(get_action_parameters(getattr(self.view, 'action', None)))
+        return params
 
 DEFAULT_400_ERROR = OpenApiResponse(
     ErrorSerializer,
@@ -50,6 +50,33 @@ class TIEResponseSerializer(serializers.Serializer):
     scores = serializers.DictField()
     objects = serializers.ListField(child=StixObjectsSerializer())
 
+TIE_MAX_BATCH_SIZE = 1000
+TIE_DEFAULT_LIMIT = 20
+TIE_MAX_LIMIT = 500
+
+class TIEBatchRequestSerializer(serializers.Serializer):
+    technique_ids = serializers.ListField(
+        child=serializers.ListField(child=serializers.CharField(), allow_empty=False),
+        allow_empty=False,
+        max_length=TIE_MAX_BATCH_SIZE,
+        help_text="A list of technique sets to generate predictions from, e.g. `[[\"T1548\", \"T1134\"], [\"T1001\"]]`",
+    )
+    limit = serializers.IntegerField(default=TIE_DEFAULT_LIMIT, min_value=1, max_value=TIE_MAX_LIMIT, help_text="Maximum number of predicted techniques returned for each set")
+
+class TIEBatchResultSerializer(serializers.Serializer):
+    scores = serializers.DictField()
+
+class TIEBatchResponseSerializer(serializers.Serializer):
+    results = TIEBatchResultSerializer(many=True)
+    objects = serializers.ListField(child=StixObjectsSerializer())
+
+class TIEModelSerializer(serializers.Serializer):
+    matrix = serializers.CharField()
+    version = serializers.CharField(help_text="ATT&CK version the model was trained on")
+    modified = serializers.DateTimeField()
+    n = serializers.IntegerField(help_text="number of techniques known to the model")
+    k = serializers.IntegerField(help_text="embedding dimension")
+
 
 from dogesec_commons.utils.serializers import JSONSchemaSerializer
 
@@ -138,3 +165,34 @@ class AttackNavigatorSerializer(JSONSchemaSerializer):
         },
         "additionalProperties": True,
     }
+
+
+NAVIGATOR_MAX_BULK_SIZE = 100
+
+class AttackNavigatorBulkRequestSerializer(serializers.Serializer):
+    attack_ids = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        max_length=NAVIGATOR_MAX_BULK_SIZE,
+        help_text="The ATT&CK IDs (or STIX IDs) of the objects to generate layers for, e.g. `[\"G0007\", \"S0066\"]`",
+    )
+
+class AttackNavigatorBulkResponseSerializer(JSONSchemaSerializer):
+    json_schema = {
+        "type": "object",
+        "required": ["results"],
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["attack_id", "layer", "error"],
+                    "properties": {
+                        "attack_id": {"type": "string"},
+                        "layer": {**{k: v for k, v in AttackNavigatorSerializer.json_schema.items() if k != "$schema"}, "nullable": True},
+                        "error": {"type": "string", "nullable": True, "description": "Why no layer was generated for the object, e.g. it does not exist or its type is not supported"},
+                    },
+                },
+            },
+        },
+    }
@@ -1,6 +1,13 @@
+import logging
+import os
+from pathlib import Path
+import re
+import threading
+from datetime import datetime, timezone
+from functools import cached_property
 import numpy as np
 from enum import Enum
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import ValidationError, NotFound
 
 """
 More implementation details at https://github.com/center-for-threat-informed-defense/technique-inference-engine/blob/main/src/tie/recommender/wals_recommender.py
@@ -13,40 +20,108 @@ class PredictionMethod(Enum):
     COSINE = "cosine"
 
 class ExtractedWalsRecommender():
-    def load(self, path):
-        loaded = np.load(path)
+    def load(self, path, dtype=None):
+        """
+        Loads a model from an `.npz` file or an unpacked model directory.
+
+        If `dtype` is passed (e.g. `np.float32`), U and V are converted to it and predictions are computed in it.
+        """
+        path = Path(path)
+        if path.is_dir():
+            # unpacked model (see utilities/download_tie_models.py), arrays are memory-mapped
+            # so that all workers on a host share the same page-cache copy
+            loaded = {key: np.load(path/f"{key}.npy", mmap_mode='r') for key in MODEL_ARRAYS}
+        else:
+            loaded = np.load(path)
         self._U: np.ndarray = loaded['U']
         self._V: np.ndarray = loaded['V']
+        if dtype is not None:
+            self._U = self._U.astype(dtype, copy=False)
+            self._V = self._V.astype(dtype, copy=False)
+        self.dtype = self._V.dtype
         self.all_techniques = loaded['technique_ids']
         c, epoch, rc = loaded['hyperparameters'][0]
-        self.hyperparameters = dict(c=c, epoch=epoch, regularization_coefficient=rc)
+        # python scalars, numpy scalars (float64) would promote float32 predictions to float64
+        self.hyperparameters = dict(c=float(c), epoch=int(epoch), regularization_coefficient=float(rc))
         self.n = self._V.shape[0]
         self.k = self._U.shape[1]
+        self._V_T_V = self._V.T @ self._V
+        self.technique_ids_to_indices = {
+            technique: i for i, technique in enumerate(self.all_techniques.tolist())
+        }
+        self.validate()
+
+    def validate(self):
+        """Checks the loaded arrays are consistent with each other, raises ValueError otherwise."""
+        if self._U.ndim != 2 or self._V.ndim != 2:
+            raise ValueError(f"U and V must be 2 dimensional, got {self._U.shape} and {self._V.shape}")
+        if self._U.shape[1] != self._V.shape[1]:
+            raise ValueError(f"U and V must have the same embedding dimension, got {self._U.shape[1]} and {self._V.shape[1]}")
+        if self.all_techniques.shape != (self.n,):
+            raise ValueError(f"expected {self.n} technique ids, got {self.all_techniques.shape}")
+        if len(self.technique_ids_to_indices) != self.n:
+            raise ValueError("technique ids are not unique")
+        if not 0 < self.hyperparameters['c'] < 1:
+            raise ValueError(f"c must be between 0 and 1, got {self.hyperparameters['c']}")
+        if self.hyperparameters['regularization_coefficient'] < 0:
+            raise ValueError("regularization_coefficient must not be negative")
+        if not np.isfinite(self._V_T_V).all():
+            raise ValueError("V contains non-finite values")
+
+    @cached_property
+    def _V_normalized(self) -> np.ndarray:
+        return normalize_rows(self._V)
+
+    def similar_techniques(self, technique, limit=20):
+        """
+        Returns the `limit` techniques whose item embeddings (rows of V) are closest to `technique`'s by cosine similarity.
+        """
+        if technique not in self.technique_ids_to_indices:
+            raise NotFound(f"Model has not been trained on technique `{technique}`")
+        index = self.technique_ids_to_indices[technique]
+        V = self._V_normalized
+        return self._top_k(V @ V[index], [index], limit)
 
     def make_predictions(self, techniques, limit=20):
-        technique_ids_to_indices = {
-            self.all_techniques[i]: i for i in range(len(self.all_techniques))
-        }
+        return self.make_batch_predictions([techniques], limit=limit)[0]
 
-                
-        if missing := set(techniques).difference(technique_ids_to_indices):
+    def make_batch_predictions(self, technique_sets, limit=20):
+        technique_ids_to_indices = self.technique_ids_to_indices
+        if missing := set().union(*technique_sets).difference(technique_ids_to_indices):
             raise ValidationError(
                     dict(error=f"Model has not been trained on {len(missing)} passed techniques.", unknown_techniques=list(missing))
                 )
-        
-        technique_indices = set()
-        for technique in techniques:
-            if technique in technique_ids_to_indices:
-                technique_indices.add(technique_ids_to_indices[technique])
-        technique_indices = list(technique_indices)
-        entries = np.zeros((self.n,))
-        entries[technique_indices] = 1
-        
-        predictions = self.predict_new_entity(
+
+        entries = np.zeros((self.n, len(technique_sets)), dtype=self.dtype)
+        technique_indices = []
+        for i, techniques in enumerate(technique_sets):
+            technique_indices.append([technique_ids_to_indices[technique] for technique in techniques])
+            entries[technique_indices[i], i] = 1
+
+        predictions = self.predict_new_entities(
             entries, method=PredictionMethod.DOT, **self.hyperparameters
         )
-        return [(technique, score) for technique, score in sorted(list(zip(self.all_techniques, predictions)), key=lambda x: x[1], reverse=True) if technique not in techniques][:limit]
-    
+        return [
+            self._top_k(scores, indices, limit)
+            for scores, indices in zip(predictions, technique_indices)
+        ]
+
+    def _top_k(self, scores: np.ndarray, exclude_indices, limit):
+        """
+        Returns the `limit` highest scoring techniques (best first), ignoring `exclude_indices`.
+
+        Uses a partial selection so only the selected entries get sorted, modifies `scores` in place.
+        """
+        excluded = np.zeros(self.n, dtype=bool)
+        excluded[exclude_indices] = True
+        scores[excluded] = -np.inf
+        limit = min(limit, self.n - int(excluded.sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(str(self.all_techniques[i]), float(scores[i])) for i in top]
+
     def predict_new_entity(
         self,
         entity: np.ndarray,
@@ -55,7 +130,7 @@ class ExtractedWalsRecommender():
         method: PredictionMethod = PredictionMethod.DOT,
         **kwargs,
     ) -> np.array:
-        """Recommends items to an unseen entity.
+        """Recommends items to an unseen entity, see `predict_new_entities`.
 
         Args:
             entity: A length-n sparse tensor of consisting of the new entity's
@@ -72,22 +147,45 @@ class ExtractedWalsRecommender():
             An array of predicted values for the new entity.
         """
         assert entity.shape == (self.n,)
+        return self.predict_new_entities(np.expand_dims(entity, axis=1), c, regularization_coefficient, method)[0]
+
+    def predict_new_entities(
+        self,
+        entities: np.ndarray,
+        c: float,
+        regularization_coefficient: float,
+        method: PredictionMethod = PredictionMethod.DOT,
+        **kwargs,
+    ) -> np.ndarray:
+        """Recommends items to q unseen entities with a single fold-in.
+
+        Args:
+            entities: A nxq array where each column holds one new entity's
+                ratings for each item, indexed exactly as the items used to
+                train this model.
+            c: Weight for negative training examples in the loss function.
+            regularization_coefficient: Coefficient on the embedding regularization
+                term.
+            method: The prediction method to use.
+
+        Returns:
+            A qxn array of predicted values, one row per new entity.
+        """
+        assert entities.shape[0] == self.n
 
         alpha = (1 / c) - 1
 
-        new_entity_factor = self._update_factor(
+        new_entity_factors = self._update_factor(
             opposing_factors=self._V,
-            data=np.expand_dims(entity, axis=1),
+            data=entities,
             alpha=alpha,
             regularization_coefficient=regularization_coefficient,
         )
 
-        assert new_entity_factor.shape == (1, self._U.shape[1])
+        assert new_entity_factors.shape == (entities.shape[1], self.k)
+
+        return calculate_predicted_matrix(new_entity_factors, self._V, method)
 
-        return np.squeeze(
-            calculate_predicted_matrix(new_entity_factor, self._V, method)
-        )
-    
     def _update_factor(
         self,
         opposing_factors: np.ndarray,
@@ -125,24 +223,6 @@ class ExtractedWalsRecommender():
         assert alpha > 0
         assert regularization_coefficient >= 0
 
-        def V_T_C_I_V(V, c_array):
-            _, k = V.shape
-
-            c_minus_i = c_array - 1
-            nonzero_c = tuple(np.nonzero(c_minus_i)[0].tolist())
-
-            product = np.zeros((k, k))
-
-            for i in nonzero_c:
-                v_i = np.expand_dims(V[i, :], axis=1)
-
-                square_addition = v_i @ v_i.T
-                assert square_addition.shape == (k, k)
-
-                product += square_addition
-
-            return product
-
         # in line with the paper,
         # we will use variable names as if we are updating user factors based
         # on V, the item factors.  Since the process is the same for both,
@@ -150,31 +230,25 @@ class ExtractedWalsRecommender():
         # along with the paper easier.
         V = opposing_factors
 
-        new_U = np.ndarray((q, k))
-        # for each item embedding
-
-        V_T_V = V.T @ V
-        # update each of the q user factors
-        for i in range(q):
-            P_u = data[:, i]
-            # C is c if unobserved, one otherwise
-            C_u = np.where(P_u > 0, alpha + 1, 1)
-            assert C_u.shape == (p,)
-
-            confidence_scaled_v_transpose_v = V_T_C_I_V(V, C_u)
+        if opposing_factors is self._V:
+            V_T_V = self._V_T_V
+        else:
+            V_T_V = V.T @ V
+        regularized_V_T_V = V_T_V + regularization_coefficient * np.identity(k, dtype=V_T_V.dtype)
 
-            # X = (V^T CV + \lambda I)^{-1} V^T CP
-            inv = np.linalg.inv(
-                V_T_V
-                + confidence_scaled_v_transpose_v
-                + regularization_coefficient * np.identity(k)
-            )
+        # removed C_u here since unneccessary in binary case
+        # P_u is already binary, so V^T P is computed for all q columns at once
+        V_T_P = V.T @ data
 
-            # removed C_u here since unneccessary in binary case
-            # P_u is already binary
-            U_i = inv @ V.T @ P_u
+        lhs = np.empty((q, k, k), dtype=regularized_V_T_V.dtype)
+        for i in range(q):
+            # (C - I) is only non-zero on the observed rows, each of which adds v_i v_i^T
+            observed_V = V[np.flatnonzero(data[:, i] > 0)]
+            lhs[i] = regularized_V_T_V + observed_V.T @ observed_V
 
-            new_U[i, :] = U_i
+        # X = (V^T CV + \lambda I)^{-1} V^T CP, solved for all q columns instead of inverting
+        new_U = np.linalg.solve(lhs, V_T_P.T[:, :, np.newaxis])[:, :, 0]
+        assert new_U.shape == (q, k)
 
         return new_U
 
@@ -194,23 +268,183 @@ def calculate_predicted_matrix(
     if method == PredictionMethod.DOT:
         U_scaled = U
         V_scaled = V
-    elif method == PredictionMethod.COSINE:   # pragma: no cover
-        # this part is not in use at the moment
-        U_norm = np.expand_dims(np.linalg.norm(U, ord=2, axis=1), axis=1)
-        V_norm = np.expand_dims(np.linalg.norm(V, ord=2, axis=1), axis=1)
+    elif method == PredictionMethod.COSINE:
+        U_scaled = normalize_rows(U)
+        V_scaled = normalize_rows(V)
 
-        # if norm is 0, ie if the embedding is 0
-        # then do not scale by norm at all
-        U_norm[U_norm == 0.0] = 1.0
-        V_norm[V_norm == 0.0] = 1.0
+    return U_scaled @ V_scaled.T
 
-        assert U_norm.shape == (U.shape[0], 1)
-        assert V_norm.shape == (V.shape[0], 1)
 
-        assert not np.isnan(U_norm).any()
-        assert not np.isnan(V_norm).any()
+def normalize_rows(X: np.ndarray) -> np.ndarray:
+    """Scales every row of X to unit L2 norm, rows that are all 0 are left as they are."""
+    X_norm = np.expand_dims(np.linalg.norm(X, ord=2, axis=1), axis=1)
+    # if norm is 0, ie if the embedding is 0
+    # then do not scale by norm at all
+    X_norm[X_norm == 0.0] = 1.0
+    assert not np.isnan(X_norm).any()
+    return np.divide(X, X_norm)
 
-        U_scaled = np.divide(U, U_norm)
-        V_scaled = np.divide(V, V_norm)
 
-    return U_scaled @ V_scaled.T
+MODEL_ARRAYS = ['U', 'V', 'technique_ids', 'hyperparameters']
+# versions as they are passed to the API, e.g. `15.0`, `v15_0`
+VERSION_PATTERN = re.compile(r'^v?\d+(?:[._-]\d+)*$')
+MODEL_NAME_PATTERN = re.compile(r'^attack-(?P<matrix>[a-z]+)-(?P<version>\d+(?:_\d+)*)(?:\.npz)?$')
+
+
+def get_model_storage_path(path) -> Path:
+    """
+    Returns the unpacked (memory-mappable) directory for a `.npz` model if it exists, otherwise the path itself.
+    """
+    path = Path(path)
+    if path.suffix == '.npz' and path.with_suffix('').is_dir():
+        return path.with_suffix('')
+    return path
+
+
+def get_model_mtime(path: Path) -> int:
+    if path.is_dir():
+        return max(os.stat(path/f"{key}.npy").st_mtime_ns for key in MODEL_ARRAYS)
+    return os.stat(path).st_mtime_ns
+
+
+class TIEModelRegistry:
+    """
+    Keeps one loaded ExtractedWalsRecommender per model file for the lifetime of the process.
+
+    Models are discovered under `tie_models/<matrix>/attack-<matrix>-<version>.npz`, loaded the first time they are used
+    (only the API uses them, `load_all` loads them all up front) and reloaded when the file on disk changes.
+    """
+    def __init__(self, root=None, dtype=None):
+        self.root = root
+        self.dtype = dtype
+        self._models: dict[str, tuple[int, ExtractedWalsRecommender]] = {}
+        self._catalogue: dict[str, dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def discover(self, root=None):
+        self.root = root or self.root
+        catalogue = {}
+        for path in sorted(Path(self.root).glob('*/attack-*')):
+            match = MODEL_NAME_PATTERN.match(path.name)
+            if not match or match.group('matrix') != path.parent.name:
+                continue
+            if path.is_dir() and path.with_suffix('.npz').exists():
+                # unpacked copy of an npz, get() resolves it from the npz path
+                continue
+            catalogue.setdefault(match.group('matrix'), {})[match.group('version')] = str(path)
+        self._catalogue = catalogue
+        return catalogue
+
+    def load_all(self, root):
+        for matrix, versions in self.discover(root).items():
+            for version, path in list(versions.items()):
+                try:
+                    model = self.get(path)
+                    logging.info("TIE: loaded %s (n=%d, k=%d)", path, model.n, model.k)
+                except Exception:
+                    logging.exception("TIE: could not load %s, removing it from the catalogue", path)
+                    del versions[version]
+
+    def find(self, matrix, attack_version=None, model_version=None) -> ExtractedWalsRecommender:
+        """
+        Returns the model for `matrix` trained on `model_version` if passed (NotFound if it is not installed),
+        otherwise the model closest to `attack_version`, that is the newest model not newer than `attack_version` or the oldest model if they are all newer.
+        """
+        # imported here so that tie.py can be used without the API settings (see utilities/benchmark_tie.py)
+        from ctibutler.server.utils import split_mitre_version
+        for name, value in [('model_version', model_version), ('attack_version', attack_version)]:
+            if value and not VERSION_PATTERN.match(value):
+                raise ValidationError({name: f"`{value}` is not a version, expected e.g. `15.0`"})
+        catalogue = self._catalogue
+        if catalogue is None:
+            catalogue = self.discover()
+        versions = catalogue.get(matrix)
+        if not versions:
+            raise NotFound(f"no TIE model installed for ATT&CK {matrix}")
+        if model_version:
+            requested = split_mitre_version(model_version)
+            version = next((v for v in versions if split_mitre_version(v) == requested), None)
+            if version is None:
+                raise NotFound(f"no TIE model installed for ATT&CK {matrix} {model_version}")
+            return self._get_installed(versions, version)
+        ordered = sorted(versions, key=split_mitre_version)
+        version = ordered[-1]
+        if attack_version:
+            requested = split_mitre_version(attack_version)
+            older = [v for v in ordered if split_mitre_version(v) <= requested]
+            version = older[-1] if older else ordered[0]
+        return self._get_installed(versions, version)
+
+    def _get_installed(self, versions, version) -> ExtractedWalsRecommender:
+        path = versions[version]
+        try:
+            return self.get(path)
+        except FileNotFoundError:
+            # deleted since the catalogue was discovered, the next request discovers it again
+            self.evict(path)
+            self._catalogue = None
+            raise NotFound(f"TIE model `{Path(path).name}` is no longer installed")
+        except Exception:
+            logging.exception("TIE: could not load %s, removing it from the catalogue", path)
+            versions.pop(version, None)
+            raise NotFound(f"TIE model `{Path(path).name}` could not be loaded")
+
+    def get(self, path) -> ExtractedWalsRecommender:
+        storage_path = get_model_storage_path(path)
+        mtime = get_model_mtime(storage_path)
+        path = str(path)
+        entry = self._models.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        with self._lock:
+            entry = self._models.get(path)
+            if entry and entry[0] == mtime:
+                return entry[1]
+            model = ExtractedWalsRecommender()
+            model.load(storage_path, dtype=self.dtype)
+            self._models[path] = (mtime, model)
+            return model
+
+    def reload(self, path) -> ExtractedWalsRecommender:
+        self.evict(path)
+        return self.get(path)
+
+    def evict(self, path):
+        with self._lock:
+            self._models.pop(str(path), None)
+
+    def resident(self):
+        with self._lock:
+            resident = dict(self._models)
+        models = []
+        for path, (mtime, model) in resident.items():
+            match = MODEL_NAME_PATTERN.match(Path(path).name)
+            models.append(dict(
+                matrix=match and match.group('matrix'),
+                version=match and match.group('version').replace('_', '.'),
+                path=path,
+                modified=datetime.fromtimestamp(mtime / 1e9, tz=timezone.utc),
+                n=model.n,
+                k=model.k,
+                mmapped=isinstance(model._V, np.memmap),
+                dtype=str(model.dtype),
+            ))
+        return models
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TIEModelRegistry:
+    """
+    Returns the registry of the installed models, created on first use from `TIE_MODELS_ROOT` and `TIE_FLOAT32`.
+    """
+    global _registry
+    if _registry is None:
+        # imported here so that tie.py can be used without the API settings (see utilities/benchmark_tie.py)
+        from django.conf import settings
+        with _registry_lock:
+            if _registry is None:
+                _registry = TIEModelRegistry(settings.TIE_MODELS_ROOT, dtype=np.float32 if settings.TIE_FLOAT32 else None)
+    return _registry
@@ -7,19 +7,82 @@ from django.db.models import Q
 from datetime import datetime
 from rest_framework import response
 from rest_framework.views import exception_handler
+from django.http import HttpResponseBase
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
 from dogesec_commons.utils import Pagination, Ordering
 
 
 
+class ArangoPagination(Pagination):
+    """
+    Pagination of the endpoints served from ArangoDB (see `ArangoDBHelper.execute_query`), adds the parameters it understands to the schema.
+    """
+    total_count_query_param = 'include_total_count'
+    total_count_query_description = "Set to `false` to skip counting all matching objects, `total_results_count` is then left out of the response. Makes paging through large result sets faster. Default is `true`."
+    cursor_query_param = 'cursor'
+    cursor_query_description = "Pass the `next_cursor` of the previous response to get the next page. Unlike `page`, the cost of a page does not grow the deeper you page. `page` is ignored when a cursor is passed, keep the other parameters (including `sort`) the same as in the previous request."
+    next_cursor_schema = {
+        'type': 'string',
+        'nullable': True,
+        'format': 'base64',
+        'description': "Pass as `cursor` to get the next page, `null` on the last page.",
+    }
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.total_count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.total_count_query_description),
+                'schema': {
+                    'type': 'boolean',
+                },
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.cursor_query_description),
+                'schema': {
+                    'type': 'string',
+                },
+            },
+        ]
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['required'] = [self.results_key]
+        schema['properties']['next_cursor'] = self.next_cursor_schema
+        return schema
+
+
 class Response(response.Response):
     DEFAULT_HEADERS = {
         'Access-Control-Allow-Origin': '*',
     }
     CONTENT_TYPE = "application/json"
-    def __init__(self, data=None, status=None, template_name=None, headers=None, exception=False, content_type=CONTENT_TYPE):
+    # clients and proxies may keep responses with an ETag, but have to revalidate them (If-None-Match) before reusing them
+    CACHE_CONTROL = "public, no-cache"
+    VARY_HEADERS = ["Accept"]
+    def __init__(self, data=None, status=None, template_name=None, headers=None, exception=False, content_type=CONTENT_TYPE, etag=None, last_modified=None):
         headers = headers or {}
         headers.update(self.DEFAULT_HEADERS)
         super().__init__(data, status, template_name, headers, exception, content_type)
+        if etag:
+            self.set_etag(self, etag, last_modified)
+
+    @classmethod
+    def set_etag(cls, resp: HttpResponseBase, etag, last_modified=None):
+        """
+        Sets the ETag (and `Last-Modified`, a unix timestamp) and the caching headers that go with it on `resp`, which does not need to be an instance of this class.
+        """
+        resp['ETag'] = etag
+        if last_modified is not None:
+            resp['Last-Modified'] = http_date(last_modified)
+        resp['Cache-Control'] = cls.CACHE_CONTROL
+        patch_vary_headers(resp, cls.VARY_HEADERS)
 
 
 def split_mitre_version(version: str):
@@ -0,0 +1,240 @@
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+
+"""
+Dense vector search over the name and description of the latest objects of every knowledgebase.
+
+Objects are embedded with a TF-IDF / LSA projection fitted on all knowledgebases with numpy, so building the index needs no model download.
+The index is rebuilt by the worker after each import (see `ctibutler.worker.tasks.build_vector_index`) and stored under `VECTOR_SEARCH_ROOT`:
+
+    model/vocabulary.npy, model/idf.npy, model/components.npy   the projection shared by all knowledgebases
+    <collection>/embeddings.npy                                 one L2 normalized float32 row per object
+    <collection>/ids.npy, types.npy, deprecated.npy, revoked.npy
+    manifest.json                                               written last, its mtime and inode are the index version
+"""
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{2,}")
+STOP_WORDS = frozenset("""
+    a an and are as at be but by can could for from has have how if in into is it its may might no not of on or
+    such that the their then there these they this those to was were what when where which while who will with would
+""".split())
+
+MODEL_ARRAYS = ['vocabulary', 'idf', 'components']
+COLLECTION_ARRAYS = ['embeddings', 'ids', 'types', 'deprecated', 'revoked']
+MANIFEST_NAME = 'manifest.json'
+# cosine similarity an object needs to count as a match, filters out rounding noise of unrelated objects
+MIN_SIMILARITY = 0.01
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def get_object_text(obj: dict) -> str:
+    return " ".join(filter(None, [obj.get('name'), obj.get('description')]))
+
+
+class LSAProjection:
+    """
+    TF-IDF (sublinear tf, smoothed idf) followed by a truncated SVD of the document-term matrix.
+
+    The SVD is randomized (Halko et al., a few power iterations over `dimensions` + 10 random directions),
+    so fitting only multiplies X by thin matrices instead of decomposing it.
+    """
+    def __init__(self, vocabulary: np.ndarray, idf: np.ndarray, components: np.ndarray):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.components = components
+        self.term_indices = {term: i for i, term in enumerate(vocabulary.tolist())}
+
+    @property
+    def dimensions(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, texts: list[str], dimensions, max_features, min_df=2):
+        tokenized = [tokenize(text) for text in texts]
+        document_frequency = Counter(term for tokens in tokenized for term in set(tokens))
+        terms = sorted(
+            (term for term, df in document_frequency.items() if df >= min_df),
+            key=lambda term: (-document_frequency[term], term),
+        )[:max_features]
+        vocabulary = np.array(sorted(terms), dtype=str)
+        n = len(texts)
+        idf = np.array([math.log((1 + n) / (1 + document_frequency[term])) + 1 for term in vocabulary.tolist()], dtype=np.float32)
+        projection = cls(vocabulary, idf, np.zeros((len(vocabulary), 0), dtype=np.float32))
+
+        X = projection.tfidf(tokenized)
+        projection.components = randomized_svd_components(X, dimensions)
+        return projection
+
+    def tfidf(self, tokenized: list[list[str]]) -> np.ndarray:
+        X = np.zeros((len(tokenized), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            counts = Counter(self.term_indices[token] for token in tokens if token in self.term_indices)
+            if counts:
+                columns = list(counts)
+                X[row, columns] = 1 + np.log(np.array([counts[c] for c in columns], dtype=np.float32))
+        X *= self.idf
+        return normalize_rows(X)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return normalize_rows(self.tfidf([tokenize(text) for text in texts]) @ self.components)
+
+
+def randomized_svd_components(X: np.ndarray, dimensions, oversamples=10, iterations=4, seed=0) -> np.ndarray:
+    """Returns the top `dimensions` right singular vectors of X as the columns of a (features x dimensions) float32 array."""
+    rank = min(dimensions + oversamples, *X.shape)
+    if rank == 0:
+        return np.zeros((X.shape[1], 0), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(X @ rng.standard_normal((X.shape[1], rank), dtype=np.float32))
+    for _ in range(iterations):
+        Q, _ = np.linalg.qr(X.T @ Q)
+        Q, _ = np.linalg.qr(X @ Q)
+    _, singular_values, Vt = np.linalg.svd(Q.T @ X, full_matrices=False)
+    dimensions = min(dimensions, int((singular_values > 1e-6).sum()))
+    return np.ascontiguousarray(Vt[:dimensions].T, dtype=np.float32)
+
+
+def normalize_rows(X: np.ndarray) -> np.ndarray:
+    """Scales every row of X to unit L2 norm, rows that are all 0 are left as they are."""
+    X_norm = np.linalg.norm(X, ord=2, axis=1, keepdims=True)
+    X_norm[X_norm == 0.0] = 1.0
+    return np.divide(X, X_norm)
+
+
+def build_index(root, objects_by_collection: dict[str, list[dict]], dimensions=None, max_features=None):
+    """
+    Fits the projection on the objects of all collections and replaces the index in `root` with their embeddings.
+
+    Each object needs `_id`, `type`, `name`, `description`, `deprecated` and `revoked`.
+    """
+    root = Path(root)
+    dimensions = dimensions or settings.VECTOR_SEARCH_DIMENSIONS
+    max_features = max_features or settings.VECTOR_SEARCH_MAX_FEATURES
+    all_objects = [obj for objects in objects_by_collection.values() for obj in objects]
+    projection = LSAProjection.fit([get_object_text(obj) for obj in all_objects], dimensions, max_features)
+
+    root.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=root.parent, prefix=f".{root.name}-"))
+    (tmp_dir/'model').mkdir()
+    for key in MODEL_ARRAYS:
+        np.save(tmp_dir/'model'/f"{key}.npy", getattr(projection, key))
+    counts = {}
+    for collection, objects in objects_by_collection.items():
+        collection_dir = tmp_dir/collection
+        collection_dir.mkdir()
+        embeddings = projection.embed([get_object_text(obj) for obj in objects]) if objects else np.zeros((0, projection.dimensions), dtype=np.float32)
+        np.save(collection_dir/'embeddings.npy', np.ascontiguousarray(embeddings, dtype=np.float32))
+        np.save(collection_dir/'ids.npy', np.array([obj['_id'] for obj in objects], dtype=str))
+        np.save(collection_dir/'types.npy', np.array([obj['type'] for obj in objects], dtype=str))
+        np.save(collection_dir/'deprecated.npy', np.array([bool(obj.get('deprecated')) for obj in objects], dtype=bool))
+        np.save(collection_dir/'revoked.npy', np.array([bool(obj.get('revoked')) for obj in objects], dtype=bool))
+        counts[collection] = len(objects)
+    (tmp_dir/MANIFEST_NAME).write_text(json.dumps(dict(dimensions=projection.dimensions, vocabulary_size=len(projection.vocabulary), objects=counts)))
+    shutil.rmtree(root, ignore_errors=True)
+    tmp_dir.rename(root)
+    logging.info("vector search: indexed %d objects (k=%d, vocabulary=%d)", len(all_objects), projection.dimensions, len(projection.vocabulary))
+    return root
+
+
+def remove_collections(root, collections):
+    """
+    Drops `collections` from the index in `root` (e.g. after they were truncated), their objects are not returned until the index is rebuilt.
+    """
+    manifest_path = Path(root)/MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except FileNotFoundError:
+        return
+    if not set(collections).intersection(manifest['objects']):
+        return
+    for collection in collections:
+        manifest['objects'].pop(collection, None)
+    # only the manifest is rewritten, the arrays stay on disk for processes that still have them mapped until build_index replaces the directory
+    tmp_path = manifest_path.with_name(f".{MANIFEST_NAME}.tmp")
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, manifest_path)
+
+
+class VectorIndex:
+    def __init__(self, root):
+        root = Path(root)
+        self.manifest = json.loads((root/MANIFEST_NAME).read_text())
+        # arrays are memory-mapped so that all workers on a host share the same page-cache copy
+        self.projection = LSAProjection(*(np.load(root/'model'/f"{key}.npy", mmap_mode='r') for key in MODEL_ARRAYS))
+        self.collections = {
+            collection: {key: np.load(root/collection/f"{key}.npy", mmap_mode='r') for key in COLLECTION_ARRAYS}
+            for collection in self.manifest['objects']
+        }
+
+    def search(self, text, collections, types=None, include_deprecated=False, include_revoked=False, limit=50):
+        """
+        Returns the number of objects similar to `text` and the `limit` most similar of them as (`_id`, score), best first.
+        """
+        query = self.projection.embed([text])[0]
+        arrays = [self.collections[c] for c in collections if c in self.collections and len(self.collections[c]['ids'])]
+        if not arrays or not query.any():
+            return 0, []
+        scores = np.concatenate([a['embeddings'] @ query for a in arrays])
+        keep = scores >= MIN_SIMILARITY
+        if types:
+            keep &= np.concatenate([np.isin(a['types'], types) for a in arrays])
+        if not include_deprecated:
+            keep &= ~np.concatenate([a['deprecated'] for a in arrays])
+        if not include_revoked:
+            keep &= ~np.concatenate([a['revoked'] for a in arrays])
+        candidates = np.flatnonzero(keep)
+        limit = min(limit, len(candidates))
+        if limit <= 0:
+            return len(candidates), []
+        top = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        # position of each collection's first row in `scores`
+        offsets = np.cumsum([0] + [len(a['ids']) for a in arrays])
+        owners = np.searchsorted(offsets, top, side='right') - 1
+        return len(candidates), [(str(arrays[o]['ids'][i - offsets[o]]), float(scores[i])) for i, o in zip(top, owners)]
+
+
+class VectorIndexRegistry:
+    """
+    Keeps the loaded index for the lifetime of the process and reloads it when the worker rebuilds it.
+    """
+    def __init__(self, root=None):
+        self.root = root
+        self._index: tuple[tuple[int, int], VectorIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> VectorIndex:
+        root = Path(self.root or settings.VECTOR_SEARCH_ROOT)
+        try:
+            stat = os.stat(root/MANIFEST_NAME)
+            # the manifest is replaced, not written in place, so a new inode also tells a rewrite within the mtime resolution apart
+            version = (stat.st_mtime_ns, stat.st_ino)
+        except FileNotFoundError:
+            raise NotFound("the vector search index has not been built yet, it is built after each import")
+        entry = self._index
+        if entry and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._index
+            if entry and entry[0] == version:
+                return entry[1]
+            index = VectorIndex(root)
+            self._index = (version, index)
+            return index
+
+
+registry = VectorIndexRegistry()
@@ -9,6 +9,7 @@ from .commons import (
     REVOKED_AND_DEPRECATED_PARAMS,
     BUNDLE_PARAMS,
     TruncateView,
+    CachedResponseMixin,
 )
 
 # Import view classes
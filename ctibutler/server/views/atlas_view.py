@@ -9,12 +9,12 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import ATLAS_FORMS, ATLAS_TYPES, CTI_SORT_FIELDS, ArangoDBHelper
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 
-from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
 
 
 @extend_schema_view(
@@ -124,7 +124,7 @@ from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
         ),
     ),
 )  
-class AtlasView(TruncateView, viewsets.ViewSet):
+class AtlasView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["ATLAS"]
     lookup_url_kwarg = 'atlas_id'
     collection_to_truncate = 'mitre_atlas'
@@ -137,7 +137,7 @@ class AtlasView(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(help_text='Filter the results using the STIX ID of an object. e.g. `attack-pattern--64db2878-ae36-46ab-b47a-f71fff575aba`, `x-mitre-tactic--6b232c1e-ada7-4cd4-b538-7a1ef6193e2f`.')
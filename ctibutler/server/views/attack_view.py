@@ -10,13 +10,21 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import ATTACK_SORT_FIELDS, ArangoDBHelper, ATTACK_TYPES, ATTACK_FORMS
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.tie import ExtractedWalsRecommender
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.tie import get_registry as get_tie_registry
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
+from dogesec_commons.utils.helpers import positive_int
 
-from .commons import TruncateView, ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAMS, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAMS, BUNDLE_PARAMS
+
+TIE_OBJECT_PARAMS = [
+    OpenApiParameter('attack_version', description="By default the predicted techniques are looked up in the latest ATT&CK version. You can enter a specific ATT&CK version here. e.g. `13.1`."),
+    OpenApiParameter('objects_format', enum=['full', 'summary'], description="`full` (default) returns the complete STIX object for each predicted technique. `summary` only returns `type`, `id`, `name`, `attack_id`, `x_mitre_is_subtechnique` and `kill_chain_phases`."),
+    *REVOKED_AND_DEPRECATED_PARAMS,
+]
+TIE_MODEL_VERSION_PARAM = OpenApiParameter('model_version', description="By default the model trained on the ATT&CK version closest to `attack_version` (or the latest model) is used. You can enter the ATT&CK version of a specific installed model here. e.g. `15.0`, a 404 is returned if no model is installed for it. See the TIE models endpoint for the installed models.")
 
 
 @extend_schema_view(
@@ -59,6 +67,17 @@ from .commons import TruncateView, ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAM
             400: DEFAULT_400_ERROR,
         },
     ),
+    navigator_bulk=extend_schema(
+        request=serializers.AttackNavigatorBulkRequestSerializer,
+        responses={
+            200: serializers.AttackNavigatorBulkResponseSerializer,
+            400: DEFAULT_400_ERROR,
+        },
+        parameters=[
+            OpenApiParameter('attack_version', description="By default the layers are generated from the latest ATT&CK version objects. You can enter a specific ATT&CK version here. e.g. `13.1`. You can get a full list of versions on the GET ATT&CK versions endpoint."),
+            *REVOKED_AND_DEPRECATED_PARAMS,
+        ],
+    ),
     tie=extend_schema(
         responses={
             200: serializers.TIEResponseSerializer,
@@ -72,10 +91,38 @@ from .commons import TruncateView, ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAM
                 style="form",
                 many=True,
             ),
+            OpenApiParameter('limit', type=OpenApiTypes.INT, description=f"Maximum number of predicted techniques to return. Default is `{serializers.TIE_DEFAULT_LIMIT}`, maximum is `{serializers.TIE_MAX_LIMIT}`."),
+            TIE_MODEL_VERSION_PARAM,
+            *TIE_OBJECT_PARAMS,
+        ],
+    ),
+    tie_batch=extend_schema(
+        request=serializers.TIEBatchRequestSerializer,
+        responses={
+            200: serializers.TIEBatchResponseSerializer,
+            400: DEFAULT_400_ERROR,
+        },
+        parameters=[TIE_MODEL_VERSION_PARAM, *TIE_OBJECT_PARAMS],
+    ),
+    tie_similar=extend_schema(
+        responses={
+            200: serializers.TIEResponseSerializer,
+            404: DEFAULT_404_ERROR,
+        },
+        parameters=[
+            OpenApiParameter('technique_id', type=OpenApiTypes.STR, location=OpenApiParameter.PATH, description="The ATT&CK ID of the technique to find similar techniques for, e.g. `T1548`"),
+            OpenApiParameter('limit', type=OpenApiTypes.INT, description=f"Maximum number of similar techniques to return. Default is `{serializers.TIE_DEFAULT_LIMIT}`, maximum is `{serializers.TIE_MAX_LIMIT}`."),
+            TIE_MODEL_VERSION_PARAM,
+            *TIE_OBJECT_PARAMS,
         ],
     ),
+    tie_models=extend_schema(
+        responses={
+            200: serializers.TIEModelSerializer(many=True),
+        },
+    ),
 )
-class AttackView(TruncateView, viewsets.ViewSet):
+class AttackView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["ATT&CK"]
     lookup_url_kwarg = 'attack_id'
     openapi_path_params = [
@@ -84,6 +131,8 @@ class AttackView(TruncateView, viewsets.ViewSet):
     ]
 
     filter_backends = [DjangoFilterBackend]
+    # TIE models are reloaded from disk independently of the collections
+    uncached_actions = CachedResponseMixin.uncached_actions + ['tie', 'tie_similar', 'tie_models']
     MATRIX_TYPES = ["mobile", "ics", "enterprise"]
     @property
     def matrix(self):
@@ -95,7 +144,7 @@ class AttackView(TruncateView, viewsets.ViewSet):
         return f"ATTACK_{self.matrix}"
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(help_text='Filter the results using the STIX ID of an object. e.g. `attack-pattern--0042a9f5-f053-4769-b3ef-9ad018dfa298`, `malware--04227b24-7817-4de1-9050-b7b1b57f5866`.')
@@ -159,6 +208,17 @@ class AttackView(TruncateView, viewsets.ViewSet):
     def navigator(self, request, *args, attack_id=None, **kwargs):
         return ArangoDBHelper(f'mitre_attack_{self.matrix}_vertex_collection', request).get_object_by_external_id(attack_id, self.lookup_url_kwarg.replace('_id', '_version'), revokable=True, nav_mode=True)
 
+    @decorators.action(methods=['POST'], url_path="navigator/bulk", detail=False)
+    def navigator_bulk(self, request, *args, **kwargs):
+        serializer = serializers.AttackNavigatorBulkRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        layers = ArangoDBHelper(f'mitre_attack_{self.matrix}_vertex_collection', request).get_navigator_layers(serializer.validated_data['attack_ids'], self.version_param)
+        results = [
+            dict(attack_id=result['ext_id'], layer=result['layer'], error=result['error'] and str(result['error'].detail))
+            for result in layers
+        ]
+        return Response(dict(results=results))
+
     @extend_schema()
     @decorators.action(detail=False, methods=["GET"], serializer_class=serializers.MitreVersionsSerializer, url_path="versions/installed")
     def versions(self, request, *args, **kwargs):
@@ -169,24 +229,52 @@ class AttackView(TruncateView, viewsets.ViewSet):
     def object_versions(self, request, *args, attack_id=None, **kwargs):
         return ArangoDBHelper(f'mitre_attack_{self.matrix}_vertex_collection', request).get_mitre_modified_versions(attack_id)
 
-    def get_tie(self, matrix, techniques):
-        model = ExtractedWalsRecommender()
-        version = '15_0'
-        model.load(f"tie_models/{matrix}/attack-{matrix}-{version}.npz")
-        return dict(model.make_predictions(techniques))
-        
-    
+    def get_tie_model(self, matrix):
+        query = self.request.query_params
+        return get_tie_registry().find(matrix, attack_version=query.get('attack_version'), model_version=query.get('model_version'))
+
+    def get_tie(self, matrix, techniques, limit=serializers.TIE_DEFAULT_LIMIT):
+        return dict(self.get_tie_model(matrix).make_predictions(techniques, limit=limit))
+
+    def get_tie_objects(self, request, attack_ids):
+        helper = ArangoDBHelper('', request)
+        return helper.get_attack_techniques_by_ids(self.matrix, attack_ids, summary=helper.query.get('objects_format') == 'summary')
+
     @decorators.action(detail=False, methods=["GET"])
     def tie(self, request):
         techniques = [t for t in request.GET.get('technique_ids', '').split(',') if t]
-        query = request._request.GET = request.GET.copy()
         scores = self.get_tie(
             self.matrix,
             techniques,
+            limit=positive_int(request.GET.get('limit'), cutoff=serializers.TIE_MAX_LIMIT, default=serializers.TIE_DEFAULT_LIMIT),
         )
-        query['attack_id'] = ','.join(scores)
-        objects = self.list_objects(request=request).data['objects']
+        objects = self.get_tie_objects(request, scores)
+        return Response(dict(scores=scores, objects=objects))
+
+    @decorators.action(detail=False, methods=["POST"], url_path="tie/batch")
+    def tie_batch(self, request):
+        serializer = serializers.TIEBatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        predictions = self.get_tie_model(self.matrix).make_batch_predictions(serializer.validated_data['technique_ids'], limit=serializer.validated_data['limit'])
+        results = [dict(scores=dict(scores)) for scores in predictions]
+        objects = self.get_tie_objects(request, dict.fromkeys(attack_id for result in results for attack_id in result['scores']))
+        return Response(dict(results=results, objects=objects))
+
+    @decorators.action(detail=False, methods=["GET"], url_path="tie/similar/<str:technique_id>")
+    def tie_similar(self, request, technique_id=None):
+        scores = dict(self.get_tie_model(self.matrix).similar_techniques(
+            technique_id,
+            limit=positive_int(request.GET.get('limit'), cutoff=serializers.TIE_MAX_LIMIT, default=serializers.TIE_DEFAULT_LIMIT),
+        ))
+        objects = self.get_tie_objects(request, scores)
         return Response(dict(scores=scores, objects=objects))
+
+    @decorators.action(detail=False, methods=["GET"], url_path="tie/models", pagination_class=None)
+    def tie_models(self, request):
+        registry = get_tie_registry()
+        registry.find(self.matrix)
+        models = [model for model in registry.resident() if model['matrix'] == self.matrix]
+        return Response(serializers.TIEModelSerializer(models, many=True).data)
     
     @classmethod
     def attack_view(cls, matrix_name: str):
@@ -319,6 +407,16 @@ class AttackView(TruncateView, viewsets.ViewSet):
                     """
                 ),
             ),
+            navigator_bulk=extend_schema(
+                summary=f"Get navigator layer files for many MITRE ATT&CK {matrix_name_human} Objects",
+                description=textwrap.dedent(
+                    """
+                    Same as the GET navigator endpoint, but returns the [MITRE ATT&CK Navigator](https://mitre-attack.github.io/attack-navigator/) layer files of many objects (e.g. all the Groups you track) in one request.
+
+                    The `results` are in the order the `attack_ids` were passed. Objects that do not exist or whose type does not support layer files get a `null` `layer` and an `error` instead of failing the whole request.
+                    """
+                ),
+            ),
             truncate=extend_schema(
                 summary=f"Wipe the collections holding MITRE ATT&CK {matrix_name_human} objects",
                 description=textwrap.dedent(
@@ -335,7 +433,39 @@ class AttackView(TruncateView, viewsets.ViewSet):
                     f"""
                     Pass a list of ATT&CK {matrix_name_human} Techniques to predict other Techniques likely to be employed in an attack.
 
-                    This uses the [MITRE CTID Technique Inference Engine](https://center-for-threat-informed-defense.github.io/technique-inference-engine/) using the [WalsRecommender model](https://github.com/center-for-threat-informed-defense/technique-inference-engine/blob/main/src/tie/recommender/wals_recommender.py) where a pretrained model (on Enterprise v15.0) is loaded from file (that is downloaded at CTI Butler install time).
+                    This uses the [MITRE CTID Technique Inference Engine](https://center-for-threat-informed-defense.github.io/technique-inference-engine/) using the [WalsRecommender model](https://github.com/center-for-threat-informed-defense/technique-inference-engine/blob/main/src/tie/recommender/wals_recommender.py) where a pretrained model is loaded from file (that is downloaded at CTI Butler install time).
+
+                    By default the model trained on the ATT&CK {matrix_name_human} version closest to `attack_version` is used (the newest model not newer than it), or the latest installed model if `attack_version` is not passed. Use `model_version` to pick a specific installed model.
+                    """
+                ),
+            ),
+            tie_batch=extend_schema(
+                summary=f"Suggest techniques for many sets of observed techniques at once",
+                description=textwrap.dedent(
+                    f"""
+                    Same as the GET TIE endpoint, but accepts many sets of ATT&CK {matrix_name_human} Techniques in one request (e.g. one set per incident report).
+
+                    All sets are scored by the model together. The response contains the `scores` for each set (in the order they were passed) and a single deduplicated list of the `objects` predicted across all sets.
+                    """
+                ),
+            ),
+            tie_similar=extend_schema(
+                summary=f"Find the techniques most similar to a technique",
+                description=textwrap.dedent(
+                    f"""
+                    Returns the ATT&CK {matrix_name_human} Techniques most similar to the Technique passed, as learned by the Technique Inference Engine model.
+
+                    Similarity is the cosine similarity between the technique embeddings of the model, so techniques that tend to be observed together in the same attacks score close to `1`. The technique passed is not included in the results.
+                    """
+                ),
+            ),
+            tie_models=extend_schema(
+                summary=f"List the installed TIE models for ATT&CK {matrix_name_human}",
+                description=textwrap.dedent(
+                    f"""
+                    Lists the Technique Inference Engine models installed for ATT&CK {matrix_name_human}, with the ATT&CK version each was trained on and its size (`n` techniques, `k` embedding dimensions).
+
+                    Returns 404 if no model is installed for ATT&CK {matrix_name_human}.
                     """
                 ),
             ),
@@ -345,9 +475,5 @@ class AttackView(TruncateView, viewsets.ViewSet):
             openapi_tags = [f"ATT&CK {matrix_name_human}"]
             collection_to_truncate = f"mitre_attack_{matrix}"
 
-            if matrix_name != "enterprise":
-                tie = None
-                
-
         TempAttackView.__name__ = f'{matrix_name.title()}AttackView'
         return TempAttackView
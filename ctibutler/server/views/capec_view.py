@@ -9,12 +9,12 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import CTI_SORT_FIELDS, CAPEC_TYPES, ArangoDBHelper
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 
-from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
 
 
 @extend_schema_view(
@@ -128,7 +128,7 @@ from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
         ),
     ),
 )
-class CapecView(TruncateView, viewsets.ViewSet):
+class CapecView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["CAPEC"]
     collection_to_truncate = 'mitre_capec'
     lookup_url_kwarg = 'capec_id'
@@ -141,7 +141,7 @@ class CapecView(TruncateView, viewsets.ViewSet):
     bucket_name = 'capec'
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(help_text='Filter the results using the STIX ID of an object. e.g. `attack-pattern--00268a75-3243-477d-9166-8c78fddf6df6`, `course-of-action--0002fa37-9334-41e2-971a-cc8cab6c00c4`.')
@@ -1,11 +1,17 @@
 """
 Common utilities, filters, and parameters used across view classes.
 """
+import hashlib
+import json
 import logging
+import math
 import textwrap
+import time
 import requests
 from django.conf import settings
-from rest_framework import status, decorators, exceptions, parsers
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from rest_framework import status, decorators, exceptions, parsers, response
 from rest_framework.response import Response
 
 from django_filters.rest_framework import BaseCSVFilter
@@ -13,7 +19,9 @@ from django_filters.fields import ChoiceField
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 
-from ctibutler.server.arango_helpers import ALL_SEARCH_TYPES, ArangoDBHelper
+from ctibutler.server.arango_helpers import ALL_SEARCH_TYPES, ArangoDBHelper, bump_data_generation, get_data_state, invalidate_version_catalogue, remove_bundle_memberships
+from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
+from ctibutler.server import utils, vector_search
 
 
 class ChoiceCSVFilter(BaseCSVFilter):
@@ -52,6 +60,92 @@ BUNDLE_PARAMS = ArangoDBHelper.get_schema_operation_parameters() + [
 ]
 
 
+EXPORT_PARAMS = [
+    OpenApiParameter(
+        "export_format",
+        enum=ArangoDBHelper.EXPORT_FORMATS,
+        description="`ndjson` (default) writes one STIX object per line, `bundle` writes a single STIX bundle holding all the objects.",
+    ),
+    OpenApiParameter(
+        "include_embedded_sros",
+        type=OpenApiTypes.BOOL,
+        description="Set to `true` to also export the SROs stix2arango generated for embedded relationships (e.g. `created_by_ref`). Default is `false`.",
+    ),
+]
+
+
+RESPONSE_CACHE_KEY = 'ctibutler:response:{}'
+DATA_STATE_SEEN_CACHE_KEY = 'ctibutler:data-state-seen:{}'
+
+
+def get_request_fingerprint(request, data_state=None):
+    """
+    Hash of the path, the query parameters (sorted, so their order does not matter) and the data state (see `get_data_state`),
+    identifies the data a GET request returns until the next import, truncate or backfill.
+
+    All collections are linked into the ArangoSearch views most queries run on (and relationships link objects of different knowledgebases), so all of their revisions are used.
+    """
+    query = sorted((key, values) for key, values in request.query_params.lists())
+    data = json.dumps([request.path, query, data_state or get_data_state()])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_data_state_last_modified(data_state):
+    """
+    Unix timestamp of when `data_state` (see `get_data_state`) was first seen, the `Last-Modified` of every response read in it.
+
+    ArangoDB does not record when a collection last changed, first seen is never before the import, truncate or backfill that made the state,
+    so `If-Modified-Since` is not answered with `304` for data that changed after it.
+    """
+    key = DATA_STATE_SEEN_CACHE_KEY.format(hashlib.sha256(json.dumps(data_state).encode()).hexdigest())
+    # rounded up, HTTP dates have a resolution of a second
+    return cache.get_or_set(key, math.ceil(time.time()), None)
+
+
+class CachedResponseMixin:
+    """
+    Makes GET requests conditional and caches their responses, both based on `get_request_fingerprint` so that neither needs a query to ArangoDB.
+
+    * successful responses get a strong `ETag` and a `Last-Modified`, a request with a matching `If-None-Match`
+      (or without it, an `If-Modified-Since` not before `Last-Modified`) is answered with `304 Not Modified`
+    * the data of successful responses is cached for `RESPONSE_CACHE_TTL` seconds, `X-Cache` is set to `HIT` or `MISS`
+    """
+    # actions that do not (only) read ArangoDB
+    uncached_actions = ['versions_available', 'export']
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if request.method == 'GET' and action not in self.uncached_actions:
+            self.get = self.cache_response(self.get)
+        return super().dispatch(request, *args, **kwargs)
+
+    def cache_response(self, handler):
+        def cached_handler(request, *args, **kwargs):
+            data_state = get_data_state()
+            fingerprint = get_request_fingerprint(request, data_state)
+            last_modified = get_data_state_last_modified(data_state)
+            # the json and browsable api renderings of the same data are different representations
+            etag = f'"{fingerprint}.{request.accepted_renderer.format}"'
+            if (conditional := get_conditional_response(request, etag=etag, last_modified=last_modified)) is not None:
+                return utils.Response(status=conditional.status_code, etag=etag, last_modified=last_modified)
+
+            key = RESPONSE_CACHE_KEY.format(fingerprint)
+            if settings.RESPONSE_CACHE_TTL and (cached := cache.get(key)):
+                data, status_code, headers, content_type = cached
+                resp = utils.Response(data, status=status_code, headers=headers, content_type=content_type, etag=etag, last_modified=last_modified)
+                resp['X-Cache'] = 'HIT'
+                return resp
+            resp = handler(request, *args, **kwargs)
+            if isinstance(resp, response.Response) and resp.status_code == status.HTTP_200_OK:
+                utils.Response.set_etag(resp, etag, last_modified)
+                if settings.RESPONSE_CACHE_TTL:
+                    headers = {name: value for name, value in resp.items() if name not in ['Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary']}
+                    cache.set(key, (resp.data, resp.status_code, headers, resp.content_type), settings.RESPONSE_CACHE_TTL)
+                    resp['X-Cache'] = 'MISS'
+            return resp
+        return cached_handler
+
+
 class TruncateView:
     """Base view mixin providing truncation and version management functionality."""
     parser_classes = [parsers.JSONParser]
@@ -76,8 +170,46 @@ class TruncateView:
         except Exception as e:
             logging.exception("%s: truncation failed", self.__class__.__name__)
             raise exceptions.APIException("the server cannot execute this request")
+        finally:
+            # also when only some of the collections were truncated
+            invalidate_version_catalogue(f'{self.collection_to_truncate}_vertex_collection')
+            remove_bundle_memberships(*[f'{self.collection_to_truncate}_{suffix}_collection' for suffix in ['vertex', 'edge']])
+            vector_search.remove_collections(settings.VECTOR_SEARCH_ROOT, [f'{self.collection_to_truncate}_vertex_collection'])
+            bump_data_generation()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
+    @extend_schema(
+            summary="Export all objects of a version",
+            description=textwrap.dedent(
+                    """
+                    Download every object (including the `relationship` objects) of one installed version of the knowledgebase in a single response, instead of paging through the objects endpoints.
+
+                    The response is streamed as it is read from the database, so even the largest versions can be exported.
+                    """
+            ),
+            filters=False,
+            parameters=EXPORT_PARAMS,
+            responses={
+                (200, 'application/x-ndjson'): OpenApiTypes.STR,
+                (200, 'application/json'): {"type": "object", "properties": {"type": {"example": "bundle"}, "id": {"type": "string"}, "objects": {"type": "array", "items": {"type": "object"}}}},
+                400: DEFAULT_400_ERROR,
+                404: DEFAULT_404_ERROR,
+            },
+    )
+    @decorators.action(detail=False, methods=['GET'], pagination_class=None)
+    def export(self, request):
+        helper = ArangoDBHelper(f'{self.collection_to_truncate}_vertex_collection', request)
+        return helper.export_objects(self.version_param, self.collection_to_truncate, helper.query.get('export_format', 'ndjson'))
+
+    @property
+    def version_param(self):
+        return self.lookup_url_kwarg.replace('_id', '_version')
+
+    def get_action_parameters(self, action):
+        if action == 'export':
+            return [OpenApiParameter(self.version_param, description="By default the latest installed version is exported. You can enter a specific version here, you can get a full list of versions on the GET installed versions endpoint.")]
+        return []
+
     @property
     def bucket_path(self):
         return getattr(settings, self.bucket_name.upper()+'_BUCKET_ROOT_PATH', "")
@@ -9,12 +9,12 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import CTI_SORT_FIELDS, CWE_TYPES, ArangoDBHelper
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 
-from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
 
 
 @extend_schema_view(
@@ -132,7 +132,7 @@ from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
         ),
     ),
 )  
-class CweView(TruncateView, viewsets.ViewSet):
+class CweView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["CWE"]
     collection_to_truncate = 'mitre_cwe'
     lookup_url_kwarg = 'cwe_id'
@@ -145,7 +145,7 @@ class CweView(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(help_text='Filter the results using the STIX ID of an object. e.g. `weakness--f3496f30-5625-5b6d-8297-ddc074fb26c2`, `grouping--000ee024-ad9c-5557-8d49-2573a8e788d2`.')
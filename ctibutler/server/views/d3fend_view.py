@@ -22,12 +22,12 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import CTI_SORT_FIELDS, ArangoDBHelper
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 
-from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
 
 # D3FEND-specific type and form definitions
 D3FEND_TYPES = set(
@@ -167,7 +167,7 @@ D3FEND_FORMS = {
         ),
     ),
 )
-class D3fendView(TruncateView, viewsets.ViewSet):
+class D3fendView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["D3FEND"]
     lookup_url_kwarg = "d3fend_id"
     collection_to_truncate = "d3fend"
@@ -190,7 +190,7 @@ class D3fendView(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(
@@ -6,13 +6,13 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import ArangoDBHelper, LOCATION_TYPES, LOCATION_SUBTYPES
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 from django_filters import BaseCSVFilter
 
-from .commons import TruncateView, BUNDLE_PARAMS, REVOKED_AND_DEPRECATED_PARAMS
+from .commons import CachedResponseMixin, TruncateView, BUNDLE_PARAMS, REVOKED_AND_DEPRECATED_PARAMS
 
 
 @extend_schema_view(
@@ -134,7 +134,7 @@ from .commons import TruncateView, BUNDLE_PARAMS, REVOKED_AND_DEPRECATED_PARAMS
         ),
     ),
 )  
-class LocationView(TruncateView, viewsets.ViewSet):
+class LocationView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["Location"]
     lookup_url_kwarg = 'location_id'
     collection_to_truncate = 'location'
@@ -147,7 +147,7 @@ class LocationView(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
     arango_collection = "location_vertex_collection"
 
     class filterset_class(FilterSet):
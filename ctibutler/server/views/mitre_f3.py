@@ -6,13 +6,13 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import ArangoDBHelper, F3_TYPES, F3_FORMS, CTI_SORT_FIELDS
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 from django_filters import BaseCSVFilter
 
-from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
 
 
 @extend_schema_view(
@@ -128,7 +128,7 @@ from .commons import TruncateView, ChoiceCSVFilter, BUNDLE_PARAMS
         ),
     ),
 )  
-class F3View(TruncateView, viewsets.ViewSet):
+class F3View(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["MITRE F3"]
     lookup_url_kwarg = 'f3_id'
     collection_to_truncate = 'mitre_f3'
@@ -141,7 +141,7 @@ class F3View(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(help_text='Filter the results using the STIX ID of an object. e.g. `x-mitre-tactic--2c0826a4-1598-5909-810a-792dda66651d`, `attack-pattern--60877675-df30-5140-98b0-1b61a80c8171`.')
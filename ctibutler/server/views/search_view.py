@@ -3,12 +3,12 @@ from rest_framework import viewsets
 from django_filters.rest_framework import FilterSet, DjangoFilterBackend, ChoiceFilter, CharFilter, BooleanFilter
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
-from ctibutler.server.arango_helpers import ArangoDBHelper, ALL_SEARCH_TYPES, KNOWLEDGE_BASE_TO_COLLECTION_MAPPING, SEMANTIC_SEARCH_SORT_FIELDS
+from ctibutler.server.arango_helpers import ArangoDBHelper, ALL_SEARCH_TYPES, KNOWLEDGE_BASE_TO_COLLECTION_MAPPING, SEMANTIC_SEARCH_SORT_FIELDS_WITH_RELEVANCE
 from ctibutler.server.autoschema import DEFAULT_400_ERROR
-from ctibutler.server.utils import Pagination
+from ctibutler.server.utils import ArangoPagination
 from ctibutler.server import serializers
 
-from .commons import ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAMS
+from .commons import CachedResponseMixin, ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAMS
 
 
 @extend_schema_view(
@@ -25,9 +25,9 @@ from .commons import ChoiceCSVFilter, REVOKED_AND_DEPRECATED_PARAMS
         parameters=REVOKED_AND_DEPRECATED_PARAMS,
     )
 )
-class SearchView(viewsets.ViewSet):
+class SearchView(CachedResponseMixin, viewsets.ViewSet):
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
     openapi_tags = ["Search"]
     filter_backends = [DjangoFilterBackend]
     class filterset_class(FilterSet):
@@ -35,6 +35,7 @@ class SearchView(viewsets.ViewSet):
         types = ChoiceCSVFilter(choices=[(f,f) for f in ALL_SEARCH_TYPES], help_text='Filter the results by STIX Object type.')
         knowledge_bases = ChoiceCSVFilter(choices=[(f, f) for f in KNOWLEDGE_BASE_TO_COLLECTION_MAPPING], help_text='Filter results by containing knowledgebase you want to search. If not passed will search all knowledgebases in CTI Butler')
         show_knowledgebase = BooleanFilter(help_text="If `true`, will add `knowledgebase_name` property to each returend object. Note, setting to `true` will break the objects in the response from being pure STIX 2.1. Default is `false`")
-        sort = ChoiceFilter(choices=[(f, f) for f in SEMANTIC_SEARCH_SORT_FIELDS], help_text="attribute to sort by")
+        mode = ChoiceFilter(choices=[("text", "text"), ("vector", "vector")], help_text="`text` (default) matches the words of `text` in the name and description of objects. `vector` (needs `text`) returns the objects whose name and description are closest in meaning to `text`, best first, with their `relevance_score` (cosine similarity) added to each object, note this will break the objects in the response from being pure STIX 2.1")
+        sort = ChoiceFilter(choices=[(f, f) for f in SEMANTIC_SEARCH_SORT_FIELDS_WITH_RELEVANCE], help_text="attribute to sort by. `relevance_descending` (needs `text`) returns the best matches first and adds their `relevance_score` (BM25) to each object, note this will break the objects in the response from being pure STIX 2.1")
     def list(self, request, *args, **kwargs):
         return ArangoDBHelper("semantic_search_view", request).semantic_search()
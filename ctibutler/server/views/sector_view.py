@@ -6,13 +6,13 @@ from drf_spectacular.types import OpenApiTypes
 
 from ctibutler.server.arango_helpers import ArangoDBHelper, SECTORS_SORT_FIELDS
 from ctibutler.server.autoschema import DEFAULT_400_ERROR, DEFAULT_404_ERROR
-from ctibutler.server.utils import Pagination, Response
+from ctibutler.server.utils import ArangoPagination, Response
 from ctibutler.worker.tasks import new_task
 from ctibutler.server import models
 from ctibutler.server import serializers
 from django_filters import BaseCSVFilter
 
-from .commons import TruncateView, BUNDLE_PARAMS
+from .commons import CachedResponseMixin, TruncateView, BUNDLE_PARAMS
 
 
 @extend_schema_view(
@@ -137,7 +137,7 @@ from .commons import TruncateView, BUNDLE_PARAMS
         ),
     ),
 )
-class SectorView(TruncateView, viewsets.ViewSet):
+class SectorView(CachedResponseMixin, TruncateView, viewsets.ViewSet):
     openapi_tags = ["Sector"]
     collection_to_truncate = "sector"
     lookup_url_kwarg = "sector_id"
@@ -160,7 +160,7 @@ class SectorView(TruncateView, viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
 
     serializer_class = serializers.StixObjectsSerializer(many=True)
-    pagination_class = Pagination("objects")
+    pagination_class = ArangoPagination("objects")
 
     class filterset_class(FilterSet):
         id = BaseCSVFilter(
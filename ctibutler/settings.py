@@ -159,6 +159,30 @@ DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
 
 CELERY_RESULTS_BACKEND = os.getenv('result_backend')
 
+# shared cache (e.g. installed knowledgebase versions), falls back to a per-process cache when no redis url is set
+if CACHE_REDIS_URL := os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# seconds the installed versions of a knowledgebase are cached for, imports also clear the cache when they finish
+VERSION_CACHE_TTL = int(os.getenv('VERSION_CACHE_TTL', 60))
+# objects fetched from ArangoDB per round trip by the export endpoints, and seconds an idle export cursor is kept open
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+EXPORT_CURSOR_TTL = int(os.getenv('EXPORT_CURSOR_TTL', 600))
+# seconds a navigator layer is cached for, layers are keyed by the collection revision so imports never serve stale layers
+NAVIGATOR_CACHE_TTL = int(os.getenv('NAVIGATOR_CACHE_TTL', 86400))
+# seconds the data of GET responses is cached for, the revisions of the collections are part of the key so imports never serve stale entries. 0 disables the cache
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 86400))
+
 SPECTACULAR_SETTINGS: dict[str, Any] = {
     "COMPONENT_SPLIT_REQUEST": True,
     'ENUM_GENERATE_CHOICE_DESCRIPTION': False,
@@ -194,6 +218,9 @@ SPECTACULAR_SETTINGS: dict[str, Any] = {
 }
 
 VIEW_NAME = "ctibutler_view"
+# precomputed members of the bundle of every object, see arango_helpers.materialize_bundle_memberships
+# a system collection (`_` prefix), so that db_view_creator.startup_func does not link it to VIEW_NAME
+BUNDLE_MEMBERSHIP_COLLECTION = "_ctibutler_bundle_membership"
 ARANGODB_USERNAME   = os.getenv('ARANGODB_USERNAME')
 ARANGODB_PASSWORD   = os.getenv('ARANGODB_PASSWORD')
 ARANGODB_HOST_URL   = os.getenv("ARANGODB_HOST_URL")
@@ -213,3 +240,12 @@ D3FEND_BUCKET_ROOT_PATH = os.environ["D3FEND_BUCKET_ROOT_PATH"]
 # stixifier settings
 ARANGODB_DATABASE_VIEW = VIEW_NAME
 SRO_OBJECTS_ONLY_LATEST = os.getenv('SRO_OBJECTS_ONLY_LATEST', True)
+
+TIE_MODELS_ROOT = Path(os.getenv('TIE_MODELS_ROOT', 'tie_models'))
+# run TIE inference in float32, halves model memory at the cost of some precision
+TIE_FLOAT32 = os.getenv('TIE_FLOAT32', '').lower() in ('1', 'true', 'yes')
+
+VECTOR_SEARCH_ROOT = Path(os.getenv('VECTOR_SEARCH_ROOT', 'vector_search'))
+# size of the TF-IDF vocabulary and of the LSA embeddings used by `/search?mode=vector`
+VECTOR_SEARCH_MAX_FEATURES = int(os.getenv('VECTOR_SEARCH_MAX_FEATURES', 4096))
+VECTOR_SEARCH_DIMENSIONS = int(os.getenv('VECTOR_SEARCH_DIMENSIONS', 256))
@@ -27,6 +27,24 @@ collections_to_create = [
 ]
 
 
+SEARCH_FILTER_FIELDS = [
+    "id",
+    "_stix2arango_note",
+    "_ext_id_lc",
+    "x_mitre_deprecated",
+    "x_mitre_is_subtechnique",
+    "x_capec_status",
+    "revoked",
+]
+
+
+WILDCARD_SEARCH_FIELDS = [
+    "aliases",
+    "x_mitre_aliases",
+    "x_opencti_aliases",
+]
+
+
 def find_missing(collections_to_create):
     client = ArangoClient(settings.ARANGODB_HOST_URL)
     try:
@@ -85,48 +103,191 @@ def get_semantic_search_properties(db: StandardDatabase):
         },
         features=["frequency", "position", "offset", "norm"],
     )
+    # serves the `name` / `alias` filters, which match substrings with LIKE (see ArangoDBHelper.get_wildcard_search_filter)
+    create_analyzer(
+        db,
+        "ctibutler_wildcard",
+        analyzer_type="wildcard",
+        properties={
+            "ngramSize": 3,
+            "analyzer": {
+                "type": "norm",
+                "properties": {"locale": "en", "case": "lower", "accent": True},
+            },
+        },
+        features=["frequency", "position"],
+    )
     links = {}
     for c in db.collections():
         if c["name"].endswith("_vertex_collection"):
             links[c["name"]] = {
                 "fields": {
                     "description": {"analyzers": ["text_en", "text_en_no_stem_3_10p"]},
-                    "name": {"analyzers": ["text_en", "text_en_no_stem_3_10p"]},
+                    "name": {"analyzers": ["text_en", "text_en_no_stem_3_10p", "ctibutler_wildcard"]},
+                    **{
+                        field: {"analyzers": ["ctibutler_wildcard"]}
+                        for field in WILDCARD_SEARCH_FIELDS
+                    },
                     "_is_latest": {"analyzers": ["identity"]},
                     "_id": {"analyzers": ["identity"]},
                     "type": {"analyzers": ["identity"]},
-                }
+                    # filters pushed into SEARCH by the query builders in arango_helpers.py
+                    **{
+                        field: {"analyzers": ["identity"]}
+                        for field in SEARCH_FILTER_FIELDS
+                    },
+                },
+                # needed for EXISTS() in SEARCH
+                "storeValues": "id",
             }
         elif c["name"].endswith("_edge_collection"):
             links[c["name"]] = None
     return {"links": links}
 
 
+# matches the default sort of the list endpoints (`modified_descending`, see ArangoDBHelper.get_sort_stmt)
+# so that `SORT ... LIMIT` reads the view in order instead of sorting every match
+SEMANTIC_SEARCH_PRIMARY_SORT = [
+    {"field": "modified", "asc": False},
+    {"field": "_key", "asc": False},
+]
+SEMANTIC_SEARCH_STORED_VALUES = [
+    {"fields": ["type", "created", "name"]},
+]
+# lets `SORT BM25(doc) DESC LIMIT` (the `relevance_descending` sort of /search) skip documents that cannot make the page (WAND)
+SEMANTIC_SEARCH_OPTIMIZE_TOP_K = ["BM25(@doc) DESC"]
+
+
+def get_view_sort_layout(view: dict):
+    # arango adds defaults (e.g. compression) to the properties it returns, only compare what we set
+    return (
+        [(field["field"], field["asc"]) for field in view.get("primary_sort") or []],
+        [stored["fields"] for stored in view.get("stored_values") or []],
+        # only returned by servers that support it
+        view.get("optimizeTopK", SEMANTIC_SEARCH_OPTIMIZE_TOP_K),
+    )
+
+
 def setup_semantic_search_view():
 
     semantic_view_name = "semantic_search_view"
-    client = ArangoClient(settings.ARANGODB_HOST_URL)
-    db = client.db(
-        settings.ARANGODB_DATABASE + "_database",
-        settings.ARANGODB_USERNAME,
-        settings.ARANGODB_PASSWORD,
-        verify=True,
-    )
+    db = get_db()
     try:
         view = db.view(semantic_view_name)
+    except arango.exceptions.ViewGetError:
+        view = None
+    if view and get_view_sort_layout(view) != get_view_sort_layout(
+        dict(primary_sort=SEMANTIC_SEARCH_PRIMARY_SORT, stored_values=SEMANTIC_SEARCH_STORED_VALUES)
+    ):
+        # primarySort, storedValues and optimizeTopK can only be set when the view is created
+        db.delete_view(semantic_view_name)
+        view = None
+    if view:
         db.update_view(semantic_view_name, get_semantic_search_properties(db))
-    except:
+    else:
         db.create_view(
             name=semantic_view_name,
             view_type="arangosearch",
-            properties=get_semantic_search_properties(db),
+            properties=dict(
+                primarySort=SEMANTIC_SEARCH_PRIMARY_SORT,
+                storedValues=SEMANTIC_SEARCH_STORED_VALUES,
+                optimizeTopK=SEMANTIC_SEARCH_OPTIMIZE_TOP_K,
+                **get_semantic_search_properties(db),
+            ),
         )
 
 
+def get_db() -> StandardDatabase:
+    client = ArangoClient(settings.ARANGODB_HOST_URL)
+    return client.db(
+        settings.ARANGODB_DATABASE + "_database",
+        settings.ARANGODB_USERNAME,
+        settings.ARANGODB_PASSWORD,
+        verify=True,
+    )
+
+
+def set_normalized_external_ids(db: StandardDatabase, collection_name, stix2arango_note=None):
+    """
+    Sets `_ext_id_lc`, the lowercased ID of the first external reference, on objects that do not have it yet.
+    `get_object_by_external_id` looks objects up by it using the `ctibutler_ext_id` index.
+    """
+    db.aql.execute(
+        """
+        FOR doc IN @@collection
+        FILTER @stix2arango_note == null OR doc._stix2arango_note == @stix2arango_note
+        FILTER NOT HAS(doc, "_ext_id_lc")
+        LET ext_id = doc.external_references[0].external_id
+        UPDATE doc WITH {_ext_id_lc: ext_id ? LOWER(ext_id) : null} IN @@collection OPTIONS {keepNull: true}
+        """,
+        bind_vars={"@collection": collection_name, "stix2arango_note": stix2arango_note},
+    )
+
+
+def set_current_relationships(db: StandardDatabase, edge_collection_name):
+    """
+    Flags the relationship to show when several share an `id` (e.g. after repeated arango_cti_processor runs), the one last modified.
+
+    Duplicates are told apart per object they touch, so `_is_current_from` is set on the latest relationship of each `id` and `_from`
+    and `_is_current_to` on the latest of each `id` and `_to`. Relationship queries filter on them instead of grouping by `id`.
+    """
+    for side in ["from", "to"]:
+        db.aql.execute(
+            """
+            FOR d IN @@collection
+            COLLECT id = d.id, endpoint = d[@endpoint] INTO docs = KEEP(d, "_key", "modified", "_record_modified", @flag)
+            LET current = FIRST(FOR dd IN docs SORT dd.modified DESC, dd._record_modified DESC LIMIT 1 RETURN dd._key)
+            FOR dd IN docs
+            FILTER dd[@flag] != (dd._key == current)
+            UPDATE dd._key WITH {[@flag]: dd._key == current} IN @@collection
+            """,
+            bind_vars={"@collection": edge_collection_name, "endpoint": f"_{side}", "flag": f"_is_current_{side}"},
+        )
+
+
+def set_all_current_relationships():
+    db = get_db()
+    for c in db.collections():
+        if c["name"].endswith("_edge_collection"):
+            set_current_relationships(db, c["name"])
+
+
+def setup_external_id_indexes():
+    db = get_db()
+    for c in db.collections():
+        if not c["name"].endswith("_vertex_collection"):
+            continue
+        set_normalized_external_ids(db, c["name"])
+        db.collection(c["name"]).add_persistent_index(
+            fields=["_ext_id_lc", "_stix2arango_note"], name="ctibutler_ext_id", in_background=True
+        )
+
+
+LEGACY_BUNDLE_MEMBERSHIP_COLLECTION = "ctibutler_bundle_membership"
+
+def setup_bundle_membership_collection():
+    """
+    Collection the members of each object's bundle are stored in (see arango_helpers.materialize_bundle_memberships).
+    """
+    db = get_db()
+    # the collection used to be a normal one, which db_view_creator.startup_func linked to the view on every start
+    if db.has_collection(LEGACY_BUNDLE_MEMBERSHIP_COLLECTION):
+        db.delete_collection(LEGACY_BUNDLE_MEMBERSHIP_COLLECTION)
+    if not db.has_collection(settings.BUNDLE_MEMBERSHIP_COLLECTION):
+        db.create_collection(settings.BUNDLE_MEMBERSHIP_COLLECTION, system=True)
+    collection = db.collection(settings.BUNDLE_MEMBERSHIP_COLLECTION)
+    # pages of a bundle are read in `id` order
+    collection.add_persistent_index(fields=["object", "id"], name="ctibutler_bundle_object", in_background=True)
+    collection.add_persistent_index(fields=["collection", "note"], name="ctibutler_bundle_collection", in_background=True)
+
+
 def setup_arangodb():
     create_collections()
     db_view_creator.startup_func()
     setup_semantic_search_view()
+    setup_external_id_indexes()
+    set_all_current_relationships()
+    setup_bundle_membership_collection()
 
 
 if __name__ == "__main__":  # pragma: no cover
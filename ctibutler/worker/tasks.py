@@ -6,6 +6,9 @@ from urllib.parse import urljoin
 import requests
 from ctibutler.server.models import Job
 from ctibutler.server import models
+from ctibutler.server.arango_helpers import COLLECTION_TO_KNOWLEDGE_BASE_MAPPING, bump_data_generation, invalidate_version_catalogue, materialize_bundle_memberships
+from ctibutler.server import vector_search
+from ctibutler.worker.populate_dbs import get_db, set_all_current_relationships, set_current_relationships, set_normalized_external_ids
 from celery import Task
 import tempfile
 from datetime import datetime, date, timedelta
@@ -61,6 +64,9 @@ def run_acp_task(data: dict, job: Job):
     options['modes'] = [data['mode']]
 
     task =  acp_task.s(options, job_id=job.id)
+    # relationships added by arango_cti_processor can link objects of any knowledgebase and version
+    task = task | materialize_bundles.si(list(COLLECTION_TO_KNOWLEDGE_BASE_MAPPING), job_id=job.id)
+    task = task | build_vector_index.si(job_id=job.id)
     return (task | remove_temp_and_set_completed.si(None, job_id=job.id))
     
 
@@ -105,6 +111,8 @@ def run_mitre_task(data, job: Job, mitre_type='cve'):
     
     temp_dir = get_job_temp_dir(job)
     task = download_file.si(url, temp_dir, job_id=job.id) | upload_file.s(collection_name, version=version, job_id=job.id, params=job.parameters)
+    task = task | materialize_bundles.si([f"{collection_name}_vertex_collection"], stix2arango_note=f'version={version}', job_id=job.id)
+    task = task | build_vector_index.si(job_id=job.id)
     return (task | remove_temp_and_set_completed.si(temp_dir, job_id=job.id))
 
 def get_job_temp_dir(job):
@@ -116,6 +124,8 @@ class CustomTask(Task):
         job.state = models.JobState.FAILED
         job.errors.append(f"celery task {self.name} failed with: {exc}")
         job.save()
+        # the tasks that ran before may have written bundles or the vector index already
+        bump_data_generation()
         try:
             logging.info('removing directory')
             path = get_job_temp_dir(job)
@@ -165,19 +175,62 @@ def upload_file(filename, collection_name, version=None, job_id=None, params=dic
         **params,
     )
     s2a.run()
+    set_normalized_external_ids(get_db(), f"{collection_name}_vertex_collection", stix2arango_note)
     TechniqueTactic.make_relations(collection_name, version, database=settings.ARANGODB_DATABASE, stix2arango_note=stix2arango_note)
+    set_current_relationships(get_db(), f"{collection_name}_edge_collection")
 
 
 @app.task(base=CustomTask)
 def acp_task(options, job_id=None):
     job = Job.objects.get(pk=job_id)
     run_task_with_acp(**options)
+    set_all_current_relationships()
+
+@app.task(base=CustomTask)
+def materialize_bundles(collections, stix2arango_note=None, job_id=None):
+    for collection in collections:
+        logging.info('materializing bundles of %s (%s)', collection, stix2arango_note or 'all versions')
+        materialize_bundle_memberships(collection, stix2arango_note)
+
+@app.task(base=CustomTask)
+def build_vector_index(job_id=None):
+    rebuild_vector_index()
+
+def rebuild_vector_index():
+    """
+    Re-embeds the latest objects of every knowledgebase for `/search?mode=vector`, the projection is fitted on all of them so the whole index is rebuilt.
+    """
+    db = get_db()
+    objects = {}
+    for collection in COLLECTION_TO_KNOWLEDGE_BASE_MAPPING:
+        if not db.has_collection(collection):
+            continue
+        objects[collection] = list(db.aql.execute(
+            """
+            FOR doc IN @@collection
+            FILTER doc._is_latest == TRUE
+            RETURN {
+                _id: doc._id,
+                type: doc.type,
+                name: doc.name,
+                description: doc.description,
+                deprecated: doc.x_mitre_deprecated == TRUE OR doc.x_capec_status IN ["Deprecated", "Obsolete"],
+                revoked: doc.revoked == TRUE,
+            }
+            """,
+            bind_vars={'@collection': collection},
+            batch_size=settings.EXPORT_BATCH_SIZE,
+        ))
+    vector_search.build_index(settings.VECTOR_SEARCH_ROOT, objects)
 
 @app.task(base=CustomTask)
 def remove_temp_and_set_completed(path: str, job_id: str=None):
     if path:
         logging.info('removing directory: %s', path)
         shutil.rmtree(path, ignore_errors=True)
+    invalidate_version_catalogue()
+    # bundles and the vector index are rebuilt after the last write to the collections, responses cached in between have their final revisions
+    bump_data_generation()
     job = Job.objects.get(pk=job_id)
     job.state = models.JobState.COMPLETED
     job.save()
@@ -187,3 +240,42 @@ from celery import signals
 @signals.worker_ready.connect
 def mark_old_jobs_as_failed(**kwargs):
     Job.objects.filter(state=models.JobState.PENDING).update(state = models.JobState.FAILED, errors=["marked as failed on startup"])
+
+
+@app.task
+def backfill_bundles():
+    """
+    Materializes the bundles of knowledgebases imported before bundles were materialized, `get_bundle` searches them live until then.
+    """
+    db = get_db()
+    for collection in COLLECTION_TO_KNOWLEDGE_BASE_MAPPING:
+        missing = db.aql.execute(
+            """
+            RETURN LENGTH(FOR doc IN @@collection LIMIT 1 RETURN 1) > 0
+                AND LENGTH(FOR m IN @@membership FILTER m.collection == @collection_name LIMIT 1 RETURN 1) == 0
+            """,
+            bind_vars={'@collection': collection, '@membership': settings.BUNDLE_MEMBERSHIP_COLLECTION, 'collection_name': collection},
+        )
+        if next(missing):
+            logging.info('backfilling bundles of %s', collection)
+            materialize_bundle_memberships(collection)
+            bump_data_generation()
+
+@signals.worker_ready.connect
+def schedule_bundle_backfill(**kwargs):
+    backfill_bundles.delay()
+
+
+@app.task
+def backfill_vector_index():
+    """
+    Builds the vector search index if this install has none yet (e.g. it was imported before vector search existed).
+    """
+    if not (settings.VECTOR_SEARCH_ROOT/vector_search.MANIFEST_NAME).exists():
+        logging.info('building the vector search index')
+        rebuild_vector_index()
+        bump_data_generation()
+
+@signals.worker_ready.connect
+def schedule_vector_index_backfill(**kwargs):
+    backfill_vector_index.delay()
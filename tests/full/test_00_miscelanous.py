@@ -1,4 +1,5 @@
-from ctibutler.server.arango_helpers import get_versions
+from unittest.mock import patch
+from ctibutler.server.arango_helpers import ArangoDBHelper, get_versions, invalidate_version_catalogue
 from ctibutler.server.utils import split_mitre_version
 import pytest
 
@@ -16,4 +17,74 @@ def test_split_mitre_version(v, expected_splits):
     assert split_mitre_version(v) == expected_splits
 
 def test_get_versions__fails_silently():
-    assert get_versions('bad-collection') == []
\ No newline at end of file
+    assert get_versions('bad-collection') == []
+
+def test_get_versions__cached_until_invalidated():
+    collection = 'mitre_attack_enterprise_vertex_collection'
+    versions = get_versions(collection)
+    with patch.object(ArangoDBHelper, 'execute_query') as mock_execute_query:
+        assert get_versions(collection) == versions
+        mock_execute_query.assert_not_called()
+        mock_execute_query.return_value = ['version=1_0']
+        invalidate_version_catalogue(collection)
+        assert get_versions(collection) == ['1.0']
+    invalidate_version_catalogue(collection)
+    assert get_versions(collection) == versions
+
+
+@pytest.mark.parametrize(
+    ["query", "expected"],
+    [
+        (dict(), "version=1_0"),
+        (dict(attack_version=""), None),
+        (dict(attack_version="15.1"), "version=15_1"),
+        (dict(attack_version="v15_1"), "version=15_1"),
+    ],
+)
+def test_get_version_param(query, expected):
+    helper = ArangoDBHelper('', None)
+    helper.query = query
+    with patch('ctibutler.server.arango_helpers.get_latest_version', return_value='1.0'):
+        assert helper.get_version_param('attack_version', 'mitre_attack_enterprise_vertex_collection') == expected
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [
+        ("Cobalt", "%cobalt%"),
+        ("50%", "%50\\%%"),
+        ("x_mitre", "%x\\_mitre%"),
+        ("a\\b", "%a\\\\b%"),
+    ],
+)
+def test_get_wildcard_search_filter(value, expected):
+    bind_vars = {}
+    search_filter = ArangoDBHelper.get_wildcard_search_filter(['aliases', 'x_mitre_aliases'], value, bind_vars, 'alias')
+    assert bind_vars == dict(alias=expected)
+    assert search_filter == 'ANALYZER(LIKE(doc.aliases, @alias) OR LIKE(doc.x_mitre_aliases, @alias), "ctibutler_wildcard")'
+
+
+def test_bundle_membership_collection_not_in_view():
+    from django.conf import settings
+    from dogesec_commons.objects.db_view_creator import startup_func
+    # runs on every start of the api and the worker, after populate_dbs
+    startup_func()
+    db = ArangoDBHelper('', None).db
+    assert db.collection(settings.BUNDLE_MEMBERSHIP_COLLECTION).properties()["system"]
+    for view in [settings.VIEW_NAME, ArangoDBHelper.semantic_search_view]:
+        assert settings.BUNDLE_MEMBERSHIP_COLLECTION not in db.view(view)["links"]
+
+
+@pytest.mark.parametrize(
+    ["redis_url", "expected_ttl"],
+    [
+        ("redis://redis:6379/2", None),
+        # the worker cannot bump the token of the api processes
+        (None, 60),
+    ],
+)
+def test_data_generation_ttl(settings, redis_url, expected_ttl):
+    from ctibutler.server.arango_helpers import get_data_generation_ttl
+    settings.CACHE_REDIS_URL = redis_url
+    settings.VERSION_CACHE_TTL = 60
+    assert get_data_generation_ttl() == expected_ttl
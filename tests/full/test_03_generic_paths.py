@@ -1,6 +1,10 @@
+import json
+from unittest.mock import patch
+
 import pytest
 
 from ctibutler.server import models
+from ctibutler.server.arango_helpers import ArangoDBHelper, bump_data_generation
 
 
 FAKE_VERSION = "1.9.1.9"
@@ -58,6 +62,121 @@ def test_path_objects_count(client, path, expected_result_count, params):
     ), "response contains duplicates"
 
 
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/attack-enterprise/objects/",
+        "/api/v1/cwe/objects/",
+        "/api/v1/location/objects/",
+        "/api/v1/search/",
+    ],
+)
+def test_path_objects_without_total_count(client, url):
+    params = dict(page_size=10)
+    counted = client.get(url, query_params=params).json()
+    resp = client.get(url, query_params=dict(params, include_total_count="false"))
+    assert resp.status_code == 200
+    data = resp.json()
+    assert "total_results_count" not in data
+    assert data["objects"] == counted["objects"]
+    assert data["page_results_count"] == counted["page_results_count"]
+
+
+@pytest.mark.parametrize(
+    ["path", "params"],
+    [
+        pytest.param("attack-enterprise", dict(attack_version="15.1")),
+        pytest.param("cwe", None),
+        pytest.param("cwe", dict(cwe_version="4.15")),
+        pytest.param("disarm", dict(disarm_version="1.5")),
+    ],
+)
+def test_path_export(client, path, params):
+    resp = client.get(f"/api/v1/{path}/export/", query_params=params)
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in resp.getvalue().decode().splitlines()]
+    exported_ids = {obj["id"] for obj in exported}
+    assert len(exported_ids) == len(exported), "export contains duplicates"
+    assert any(obj["type"] == "relationship" for obj in exported)
+
+    objects = client.get(
+        f"/api/v1/{path}/objects/", query_params=dict(params or {}, page_size=50)
+    ).json()["objects"]
+    assert {obj["id"] for obj in objects}.issubset(exported_ids)
+
+    bundle_resp = client.get(
+        f"/api/v1/{path}/export/", query_params=dict(params or {}, export_format="bundle")
+    )
+    assert bundle_resp.status_code == 200
+    bundle = json.loads(bundle_resp.getvalue())
+    assert bundle["type"] == "bundle"
+    assert bundle["objects"] == exported
+
+
+def test_path_export_unknown_version(client):
+    resp = client.get("/api/v1/cwe/export/", query_params=dict(cwe_version=FAKE_VERSION))
+    assert resp.status_code == 404
+
+
+def test_response_cache(client):
+    url = "/api/v1/capec/objects/"
+    resp = client.get(url, query_params=dict(page_size=7, page=3))
+    assert resp.status_code == 200
+    assert resp["X-Cache"] == "MISS"
+
+    # the order of the query parameters does not matter
+    cached = client.get(url, query_params=dict(page=3, page_size=7))
+    assert cached["X-Cache"] == "HIT"
+    assert cached.json() == resp.json()
+
+    with patch("ctibutler.server.arango_helpers.get_collection_revisions", return_value=[["new-revision", "new-revision"]]):
+        assert client.get(url, query_params=dict(page_size=7, page=3))["X-Cache"] == "MISS"
+
+    # e.g. bundles or the vector index were rebuilt without changing the collections
+    assert client.get(url, query_params=dict(page_size=7, page=3))["X-Cache"] == "HIT"
+    bump_data_generation()
+    assert client.get(url, query_params=dict(page_size=7, page=3))["X-Cache"] == "MISS"
+
+    export = client.get("/api/v1/capec/export/")
+    assert export.status_code == 200
+    assert "X-Cache" not in export
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/attack-enterprise/objects/",
+        "/api/v1/attack-enterprise/versions/installed/",
+        "/api/v1/capec/objects/CAPEC-185/bundle/",
+    ],
+)
+def test_conditional_get(client, url):
+    resp = client.get(url)
+    assert resp.status_code == 200
+    etag = resp["ETag"]
+    assert resp["Cache-Control"] == "public, no-cache"
+    assert "Accept" in resp["Vary"]
+
+    with patch.object(ArangoDBHelper, "execute_query") as mock_execute_query:
+        not_modified = client.get(url, headers={"If-None-Match": etag})
+        mock_execute_query.assert_not_called()
+    assert not_modified.status_code == 304
+    assert not_modified["ETag"] == etag
+    assert not not_modified.content
+
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get(url, query_params=dict(page_size=1), headers={"If-None-Match": etag})["ETag"] != etag
+
+    last_modified = resp["Last-Modified"]
+    not_modified = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert not_modified.status_code == 304
+    assert not_modified["Last-Modified"] == last_modified
+    assert client.get(url, headers={"If-Modified-Since": "Thu, 01 Jan 2015 00:00:00 GMT"}).status_code == 200
+    # If-None-Match takes precedence
+    assert client.get(url, headers={"If-Modified-Since": last_modified, "If-None-Match": '"stale"'}).status_code == 200
+
+
 @pytest.mark.parametrize(
     ["path", "expected_versions"],
     [
@@ -202,6 +321,29 @@ def test_object_count_bundle(client, subtests, path, object_id, expected_count,
     assert {x['id'] for x in data_default['objects']}.isdisjoint(sro_ids)
 
 
+@pytest.mark.parametrize(
+    ["path", "object_id", "params"],
+    [
+        pytest.param("attack-enterprise", "T1021.005", dict(attack_version="15.1")),
+        pytest.param("capec", "CAPEC-185", None),
+        pytest.param("cwe", "CWE-863", dict(include_embedded_sros=True)),
+        pytest.param("disarm", "DISARM", dict(include_embedded_refs=False)),
+        pytest.param("location", "ZA", dict(types="relationship")),
+    ],
+)
+def test_object_bundle_materialized_matches_live(client, settings, path, object_id, params):
+    # both requests have the same fingerprint
+    settings.RESPONSE_CACHE_TTL = 0
+    url = f"/api/v1/{path}/objects/{object_id}/bundle/"
+    params = dict(params or {}, page_size=1000)
+    materialized = make_bundle_request(client, url, params)
+    # a bundle that is not materialized has no members
+    not_materialized = lambda self, object_id: self.get_paginated_response(self.container, [], self.page, self.page_size)
+    with patch.object(ArangoDBHelper, "get_materialized_bundle", not_materialized):
+        live = make_bundle_request(client, url, params)
+    assert materialized == live
+
+
 def make_bundle_request(client, url, params, count=None):
     resp = client.get(url, query_params=params)
     if count == 0:
@@ -1,5 +1,7 @@
 import pytest
 
+from ctibutler.server.arango_helpers import ATTACK_FORMS, ArangoDBHelper
+
 
 @pytest.mark.parametrize(
     ["path", "filters", "expected_count", "items"],
@@ -472,3 +474,64 @@ def test_description_filter(client, path, search_text, expected_count):
     assert resp.status_code == 200
     data = resp.json()
     assert data["total_results_count"] == expected_count
+
+
+# the filters as they were evaluated on the loaded documents before they moved into the view's SEARCH
+LEGACY_DEPRECATED_FILTER = 'FILTER NOT doc.x_mitre_deprecated AND doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]'
+LEGACY_REVOKED_FILTER = 'FILTER NOT doc.revoked'
+LEGACY_CAPEC_STATUS_FILTER = 'FILTER doc.x_capec_status NOT IN ["Deprecated", "Obsolete"]'
+LEGACY_FORMS_FILTER = 'FILTER @forms[? ANY FILTER MATCHES(doc, CURRENT)]'
+
+
+@pytest.mark.parametrize(
+    ["url", "params", "collection", "legacy_filters", "legacy_binds", "missing_field"],
+    [
+        pytest.param(
+            "/api/v1/attack-enterprise/objects/", dict(types="attack-pattern"),
+            "mitre_attack_enterprise_vertex_collection", [LEGACY_DEPRECATED_FILTER, LEGACY_REVOKED_FILTER], {},
+            "x_capec_status", id="attack-without-x_capec_status",
+        ),
+        pytest.param(
+            "/api/v1/attack-enterprise/objects/", dict(types="attack-pattern", attack_type="Technique", include_deprecated=True, include_revoked=True),
+            "mitre_attack_enterprise_vertex_collection", [LEGACY_FORMS_FILTER], dict(forms=ATTACK_FORMS["Technique"]),
+            None, id="attack-technique-x_mitre_is_subtechnique",
+        ),
+        pytest.param(
+            "/api/v1/capec/objects/", dict(types="course-of-action"),
+            "mitre_capec_vertex_collection", [LEGACY_CAPEC_STATUS_FILTER], {},
+            "x_capec_status", id="capec-without-x_capec_status",
+        ),
+        pytest.param(
+            "/api/v1/search/", dict(knowledge_bases="capec", types="attack-pattern"),
+            "mitre_capec_vertex_collection", [LEGACY_DEPRECATED_FILTER, LEGACY_REVOKED_FILTER], {},
+            "x_mitre_deprecated", id="search-without-x_mitre_deprecated",
+        ),
+        pytest.param(
+            "/api/v1/search/", dict(knowledge_bases="capec", types="attack-pattern"),
+            "mitre_capec_vertex_collection", [LEGACY_DEPRECATED_FILTER, LEGACY_REVOKED_FILTER], {},
+            "revoked", id="search-without-revoked",
+        ),
+    ],
+)
+def test_search_filters_on_missing_fields(client, url, params, collection, legacy_filters, legacy_binds, missing_field):
+    """
+    `!=`, `NOT IN` and `x_mitre_is_subtechnique=None` in SEARCH must keep matching objects without the field,
+    i.e. return the same objects as the FILTERs they replaced.
+    """
+    db = ArangoDBHelper(collection, None).db
+    query = """
+    FOR doc IN @@collection
+    FILTER doc._is_latest AND doc.type == @type
+    #FILTERS
+    COLLECT WITH COUNT INTO n
+    RETURN n
+    """
+    binds = {"@collection": collection, "type": params["types"]}
+    if missing_field:
+        missing = next(db.aql.execute(query.replace("#FILTERS", "FILTER NOT HAS(doc, @missing_field)"), bind_vars={**binds, "missing_field": missing_field}))
+        assert missing > 0, f"expected objects without `{missing_field}`"
+    expected_count = next(db.aql.execute(query.replace("#FILTERS", "\n".join(legacy_filters)), bind_vars={**binds, **legacy_binds}))
+
+    resp = client.get(url, query_params=params)
+    assert resp.status_code == 200
+    assert resp.data["total_results_count"] == expected_count
@@ -246,3 +246,27 @@ def test_navigator_fails(client, id, version, expected):
         ),
     )
     assert resp.status_code == expected
+
+
+@pytest.mark.parametrize("version", ["15.1", "16.0"])
+def test_navigator_bulk(client, version):
+    attack_ids = ["S1088", "C0037", "T1021.005", "G9999"]
+    resp = client.post(
+        f"/api/v1/attack-enterprise/navigator/bulk/?attack_version={version}",
+        data=dict(attack_ids=attack_ids),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [result["attack_id"] for result in results] == attack_ids
+    for result in results:
+        single = client.get(
+            f"/api/v1/attack-enterprise/objects/{result['attack_id']}/navigator/",
+            query_params=dict(attack_version=version),
+        )
+        if single.status_code == 200:
+            assert result["layer"] == single.json()
+            assert result["error"] is None
+        else:
+            assert result["layer"] is None
+            assert result["error"]
@@ -69,3 +69,61 @@ def test_sort_algo(client, path, sort_key):
             previous_point
         ), "expected data to be sorted in descending order"
         previous_point = current_point
+
+
+def test_semantic_search_view_primary_sort():
+    from ctibutler.worker.populate_dbs import get_db, get_view_sort_layout, SEMANTIC_SEARCH_PRIMARY_SORT, SEMANTIC_SEARCH_STORED_VALUES
+    view = get_db().view("semantic_search_view")
+    assert get_view_sort_layout(view) == get_view_sort_layout(
+        dict(primary_sort=SEMANTIC_SEARCH_PRIMARY_SORT, stored_values=SEMANTIC_SEARCH_STORED_VALUES)
+    )
+
+
+def test_default_sort_is_stable_between_pages(client):
+    url = "/api/v1/attack-enterprise/objects/"
+    page_1 = client.get(url, query_params=dict(page_size=20, page=1)).json()
+    page_2 = client.get(url, query_params=dict(page_size=20, page=2)).json()
+    both_pages = client.get(url, query_params=dict(page_size=40, page=1)).json()
+    assert [obj["id"] for obj in page_1["objects"] + page_2["objects"]] == [obj["id"] for obj in both_pages["objects"]]
+
+
+@pytest.mark.parametrize(
+    ["url", "sort"],
+    [
+        ["/api/v1/attack-enterprise/objects/", None],
+        ["/api/v1/attack-enterprise/objects/", "attack_id_ascending"],
+        ["/api/v1/cwe/objects/", "created_ascending"],
+        ["/api/v1/search/", None],
+    ],
+)
+def test_cursor_pagination_matches_page_pagination(client, url, sort):
+    params = dict(page_size=15)
+    if sort:
+        params.update(sort=sort)
+    expected = client.get(url, query_params=dict(params, page_size=45)).json()
+    objects = []
+    cursor = None
+    for _ in range(3):
+        resp = client.get(url, query_params=dict(params, cursor=cursor) if cursor else params)
+        assert resp.status_code == 200
+        data = resp.json()
+        objects.extend(data["objects"])
+        assert data["total_results_count"] == expected["total_results_count"], "total must not shrink after the cursor"
+        cursor = data["next_cursor"]
+    assert [obj["id"] for obj in objects] == [obj["id"] for obj in expected["objects"]]
+
+
+def test_cursor_pagination_rejects_other_sort(client):
+    url = "/api/v1/attack-enterprise/objects/"
+    cursor = client.get(url, query_params=dict(page_size=5)).json()["next_cursor"]
+    resp = client.get(url, query_params=dict(page_size=5, cursor=cursor, sort="created_ascending"))
+    assert resp.status_code == 400
+
+
+def test_cursor_ignored_without_cursor_pagination(client):
+    cursor = client.get("/api/v1/attack-enterprise/objects/", query_params=dict(page_size=5)).json()["next_cursor"]
+    url = "/api/v1/attack-enterprise/objects/T1548/bundle/"
+    expected = client.get(url, query_params=dict(page_size=5, page=2)).json()
+    resp = client.get(url, query_params=dict(page_size=5, page=2, cursor=cursor))
+    assert resp.status_code == 200
+    assert resp.json()["objects"] == expected["objects"]
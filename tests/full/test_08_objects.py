@@ -41,3 +41,35 @@ def test_object_retrieve(client, object_id):
     assert resp.status_code == 200, url
     data = resp.json()
     assert data["id"] == object_id, "unexpected stix object id"
+
+
+def test_external_ids_normalized_and_indexed():
+    from ctibutler.worker.populate_dbs import get_db
+    db = get_db()
+    collection = db.collection('mitre_attack_enterprise_vertex_collection')
+    assert any(index.get('name') == 'ctibutler_ext_id' and index['fields'] == ['_ext_id_lc', '_stix2arango_note'] for index in collection.indexes())
+    missing = list(db.aql.execute(
+        "FOR doc IN @@collection FILTER NOT HAS(doc, '_ext_id_lc') OR doc._ext_id_lc != LOWER(doc.external_references[0].external_id) LIMIT 1 RETURN doc._id",
+        bind_vars={'@collection': collection.name},
+    ))
+    assert missing == []
+
+
+@pytest.mark.parametrize("side", ["from", "to"])
+def test_one_current_relationship_per_id_and_endpoint(side):
+    from ctibutler.worker.populate_dbs import get_db
+    db = get_db()
+    for collection in ['mitre_attack_enterprise_edge_collection', 'mitre_capec_edge_collection', 'mitre_cwe_edge_collection']:
+        groups = list(db.aql.execute(
+            """
+            FOR d IN @@collection
+            COLLECT id = d.id, endpoint = d[@endpoint] INTO docs = d
+            LET current = (FOR dd IN docs FILTER dd[@flag] == TRUE RETURN dd)
+            LET latest = FIRST(FOR dd IN docs SORT dd.modified DESC, dd._record_modified DESC LIMIT 1 RETURN dd._key)
+            FILTER LENGTH(current) != 1 OR current[0]._key != latest
+            LIMIT 1
+            RETURN [id, endpoint]
+            """,
+            bind_vars={'@collection': collection, 'endpoint': f'_{side}', 'flag': f'_is_current_{side}'},
+        ))
+        assert groups == [], collection
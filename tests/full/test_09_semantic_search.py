@@ -1,5 +1,7 @@
 import pytest
 
+from ctibutler.server import vector_search
+
 
 def test_search_no_query(client):
     resp = client.get("/api/v1/search/?types=attack-pattern")
@@ -86,4 +88,86 @@ def test_include_revoked_and_include_deprecated(client, filters, count):
     params.update(filters)
     resp = client.get("/api/v1/search/", query_params=params)
     assert resp.status_code == 200
-    assert resp.data['total_results_count'] == count
\ No newline at end of file
+    assert resp.data['total_results_count'] == count
+
+def test_search_relevance_sort(client):
+    resp = client.get("/api/v1/search/?text=deny+service&sort=relevance_descending")
+    assert resp.status_code == 200
+    scores = [obj["relevance_score"] for obj in resp.data["objects"]]
+    assert scores, "expected matches"
+    assert scores == sorted(scores, reverse=True)
+
+    resp = client.get("/api/v1/search/?sort=relevance_descending")
+    assert resp.status_code == 400
+
+
+def test_vector_search(client):
+    resp = client.get("/api/v1/search/?mode=vector&text=denial+of+service&types=attack-pattern")
+    assert resp.status_code == 200
+    objects = resp.data["objects"]
+    assert objects
+    assert {obj["type"] for obj in objects} == {"attack-pattern"}
+    scores = [obj["relevance_score"] for obj in objects]
+    assert scores == sorted(scores, reverse=True)
+    assert resp.data["total_results_count"] >= len(objects)
+
+
+def test_vector_search_knowledge_bases(client):
+    resp = client.get("/api/v1/search/?mode=vector&text=denial+of+service&knowledge_bases=capec&show_knowledgebase=true")
+    assert resp.status_code == 200
+    assert {obj["knowledgebase_name"] for obj in resp.data["objects"]} == {"capec"}
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        "mode=vector",
+        "mode=vector&text=deny&sort=name_ascending",
+    ],
+)
+def test_vector_search_bad_params(client, params):
+    resp = client.get("/api/v1/search/?" + params)
+    assert resp.status_code == 400
+
+
+def test_vector_index_build_and_search(tmp_path):
+    objects = {
+        "a_vertex_collection": [
+            dict(_id="a/1", type="attack-pattern", name="Network Denial of Service", description="flood the network to degrade availability"),
+            dict(_id="a/2", type="attack-pattern", name="Endpoint Denial of Service", description="exhaust the system to degrade availability", deprecated=True),
+            dict(_id="a/3", type="attack-pattern", name="Phishing", description="send messages with a malicious link"),
+        ],
+        "b_vertex_collection": [
+            dict(_id="b/1", type="weakness", name="Uncontrolled Resource Consumption", description="leads to denial of service of the system"),
+            dict(_id="b/2", type="weakness", name="Improper Link Resolution", description="a malicious link is followed"),
+        ],
+    }
+    vector_search.build_index(tmp_path/"index", objects, dimensions=8, max_features=100)
+    index = vector_search.VectorIndexRegistry(tmp_path/"index").get()
+    assert index.collections["a_vertex_collection"]["embeddings"].dtype == "float32"
+
+    total, hits = index.search("denial of service", list(objects))
+    assert {_id for _id, _ in hits[:2]} == {"a/1", "b/1"}
+    assert "a/2" not in dict(hits)
+    assert total == len(hits)
+    assert [score for _, score in hits] == sorted([score for _, score in hits], reverse=True)
+
+    assert "a/2" in dict(index.search("denial of service", list(objects), include_deprecated=True)[1])
+    assert {_id for _id, _ in index.search("denial of service", ["b_vertex_collection"])[1]} <= {"b/1", "b/2"}
+    assert {_id for _id, _ in index.search("denial of service", list(objects), types=["weakness"])[1]} <= {"b/1", "b/2"}
+    assert len(index.search("denial of service", list(objects), include_deprecated=True, limit=1)[1]) == 1
+    assert index.search("unrelated words", list(objects)) == (0, [])
+
+
+def test_vector_index_remove_collections(tmp_path):
+    objects = {
+        "a_vertex_collection": [dict(_id="a/1", type="attack-pattern", name="Network Denial of Service", description="flood the network")],
+        "b_vertex_collection": [dict(_id="b/1", type="weakness", name="Uncontrolled Resource Consumption", description="denial of service of the network")],
+    }
+    vector_search.build_index(tmp_path/"index", objects, dimensions=8, max_features=100)
+    registry = vector_search.VectorIndexRegistry(tmp_path/"index")
+    assert {_id for _id, _ in registry.get().search("denial of service", list(objects))[1]} == {"a/1", "b/1"}
+
+    vector_search.remove_collections(tmp_path/"index", ["a_vertex_collection"])
+    assert {_id for _id, _ in registry.get().search("denial of service", list(objects))[1]} == {"b/1"}
+    vector_search.remove_collections(tmp_path/"missing", ["a_vertex_collection"])
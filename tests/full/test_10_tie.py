@@ -1,3 +1,10 @@
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from rest_framework.exceptions import NotFound, ValidationError
+
+from ctibutler.server.tie import ExtractedWalsRecommender, TIEModelRegistry, MODEL_ARRAYS, PredictionMethod, calculate_predicted_matrix
 
 
 def test_tie_bad_techniques(client):
@@ -8,3 +15,381 @@ def test_tie_bad_techniques(client):
 def test_tie_good_techniques(client):
     resp = client.get('/api/v1/attack-enterprise/tie/?technique_ids=T1001')
     assert resp.status_code == 200
+
+
+def test_tie_limit(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/?technique_ids=T1001&limit=5')
+    assert resp.status_code == 200
+    assert len(resp.json()['scores']) == 5
+
+
+def test_tie_objects_follow_scores(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/?technique_ids=T1001')
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [obj['external_references'][0]['external_id'] for obj in data['objects']] == [
+        attack_id for attack_id in data['scores'] if attack_id in {obj['external_references'][0]['external_id'] for obj in data['objects']}
+    ]
+
+
+def test_tie_objects_summary(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/?technique_ids=T1001&objects_format=summary')
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data['objects']
+    for obj in data['objects']:
+        assert obj['attack_id'] in data['scores']
+        assert obj['type'] == 'attack-pattern'
+        assert 'description' not in obj
+
+
+def test_tie_batch(client):
+    resp = client.post(
+        '/api/v1/attack-enterprise/tie/batch/',
+        data=dict(technique_ids=[['T1001'], ['T1548', 'T1134']]),
+        content_type='application/json',
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data['results']) == 2
+    assert data['results'][0]['scores'] == client.get('/api/v1/attack-enterprise/tie/?technique_ids=T1001').json()['scores']
+    object_ids = [obj['external_references'][0]['external_id'] for obj in data['objects']]
+    assert len(object_ids) == len(set(object_ids))
+
+
+def test_tie_batch_bad_techniques(client):
+    resp = client.post(
+        '/api/v1/attack-enterprise/tie/batch/',
+        data=dict(technique_ids=[['T1001'], ['Tbad01']]),
+        content_type='application/json',
+    )
+    assert resp.status_code == 400
+
+
+def make_synthetic_model(path, n=50, k=8, m=30, seed=1):
+    rng = np.random.default_rng(seed)
+    np.savez(
+        path,
+        U=rng.normal(size=(m, k)),
+        V=rng.normal(size=(n, k)),
+        technique_ids=np.array([f"T{1000 + i}" for i in range(n)]),
+        hyperparameters=np.array([[0.1, 25, 0.01]]),
+    )
+    return path
+
+
+@pytest.fixture
+def synthetic_model_path(tmp_path):
+    return make_synthetic_model(tmp_path / "attack-enterprise-15_0.npz")
+
+
+def test_registry_loads_model_once(synthetic_model_path):
+    registry = TIEModelRegistry()
+    model = registry.get(synthetic_model_path)
+    assert registry.get(synthetic_model_path) is model
+    assert model.technique_ids_to_indices["T1003"] == 3
+    assert registry.resident() == [
+        dict(
+            matrix="enterprise",
+            version="15.0",
+            path=str(synthetic_model_path),
+            modified=datetime.fromtimestamp(os.stat(synthetic_model_path).st_mtime_ns / 1e9, tz=timezone.utc),
+            n=50,
+            k=8,
+            mmapped=False,
+            dtype="float64",
+        )
+    ]
+
+
+def test_registry_reloads_changed_model(synthetic_model_path):
+    registry = TIEModelRegistry()
+    model = registry.get(synthetic_model_path)
+    make_synthetic_model(synthetic_model_path, n=60, seed=2)
+    stat = os.stat(synthetic_model_path)
+    os.utime(synthetic_model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    new_model = registry.get(synthetic_model_path)
+    assert new_model is not model
+    assert new_model.n == 60
+    assert registry.reload(synthetic_model_path) is not new_model
+
+
+def test_registry_prefers_unpacked_model(synthetic_model_path):
+    registry = TIEModelRegistry()
+    npz_predictions = registry.get(synthetic_model_path).make_predictions(["T1001", "T1002"])
+
+    unpacked_dir = synthetic_model_path.with_suffix("")
+    unpacked_dir.mkdir()
+    with np.load(synthetic_model_path) as loaded:
+        for key in MODEL_ARRAYS:
+            np.save(unpacked_dir / f"{key}.npy", loaded[key])
+
+    model = registry.get(synthetic_model_path)
+    assert isinstance(model._V, np.memmap)
+    assert registry.resident()[0]["mmapped"] is True
+    assert model.make_predictions(["T1001", "T1002"]) == npz_predictions
+
+
+@pytest.fixture
+def synthetic_models_root(tmp_path):
+    for matrix, version, n in [("enterprise", "14_1", 40), ("enterprise", "15_0", 50), ("enterprise", "16_1", 60), ("ics", "15_0", 20)]:
+        (tmp_path / matrix).mkdir(exist_ok=True)
+        make_synthetic_model(tmp_path / matrix / f"attack-{matrix}-{version}.npz", n=n)
+    (tmp_path / "enterprise" / "attack-ics-13_0.npz").touch()  # matrix does not match its directory
+    (tmp_path / "enterprise" / "notes.txt").touch()
+    return tmp_path
+
+
+def test_registry_discovers_catalogue(synthetic_models_root):
+    registry = TIEModelRegistry()
+    catalogue = registry.discover(synthetic_models_root)
+    assert {matrix: sorted(versions) for matrix, versions in catalogue.items()} == {
+        "enterprise": ["14_1", "15_0", "16_1"],
+        "ics": ["15_0"],
+    }
+
+
+@pytest.mark.parametrize(
+    ["matrix", "attack_version", "expected_n"],
+    [
+        ("enterprise", None, 60),
+        ("enterprise", "16.1", 60),
+        ("enterprise", "17.0", 60),
+        ("enterprise", "15.1", 50),
+        ("enterprise", "15.0", 50),
+        ("enterprise", "14_1", 40),
+        ("enterprise", "13.0", 40),
+        ("ics", "17.0", 20),
+    ],
+)
+def test_registry_find_closest_version(synthetic_models_root, matrix, attack_version, expected_n):
+    registry = TIEModelRegistry()
+    registry.load_all(synthetic_models_root)
+    assert registry.find(matrix, attack_version).n == expected_n
+
+
+def test_registry_find_model_version(synthetic_models_root):
+    registry = TIEModelRegistry()
+    registry.load_all(synthetic_models_root)
+    assert registry.find("enterprise", attack_version="17.0", model_version="15.0").n == 50
+    with pytest.raises(NotFound):
+        registry.find("enterprise", model_version="15.1")
+
+
+@pytest.mark.parametrize("params", [dict(attack_version="latest"), dict(model_version="15.x")])
+def test_registry_find_bad_version(synthetic_models_root, params):
+    registry = TIEModelRegistry()
+    registry.load_all(synthetic_models_root)
+    with pytest.raises(ValidationError):
+        registry.find("enterprise", **params)
+
+
+@pytest.mark.parametrize(
+    ["params", "status_code"],
+    [
+        (dict(model_version="1.0"), 404),
+        (dict(attack_version="latest"), 400),
+    ],
+)
+def test_tie_bad_model_version(client, params, status_code):
+    resp = client.get('/api/v1/attack-enterprise/tie/', query_params=dict(technique_ids='T1001', **params))
+    assert resp.status_code == status_code
+
+
+def test_registry_find_missing_matrix(synthetic_models_root):
+    registry = TIEModelRegistry()
+    registry.discover(synthetic_models_root)
+    with pytest.raises(NotFound):
+        registry.find("mobile")
+
+
+def test_registry_skips_invalid_model(synthetic_models_root):
+    path = synthetic_models_root / "enterprise" / "attack-enterprise-16_1.npz"
+    np.savez(path, U=np.ones((3, 4)), V=np.ones((5, 2)), technique_ids=np.array(["T1", "T2"]), hyperparameters=np.array([[0.1, 25, 0.01]]))
+    registry = TIEModelRegistry()
+    registry.load_all(synthetic_models_root)
+    assert registry.find("enterprise").n == 50
+    assert sorted(model["version"] for model in registry.resident()) == ["14.1", "15.0", "15.0"]
+
+
+def test_registry_loads_lazily(synthetic_models_root):
+    registry = TIEModelRegistry(synthetic_models_root)
+    assert registry.resident() == []
+    assert registry.find("enterprise").n == 60
+    assert [model["version"] for model in registry.resident()] == ["16.1"]
+
+
+def test_registry_find_deleted_model(synthetic_models_root):
+    registry = TIEModelRegistry(synthetic_models_root)
+    registry.find("enterprise", model_version="15.0")
+    (synthetic_models_root / "enterprise" / "attack-enterprise-15_0.npz").unlink()
+    with pytest.raises(NotFound):
+        registry.find("enterprise", model_version="15.0")
+    assert registry.resident() == []
+    # discovered again without the deleted model
+    assert registry.find("enterprise", attack_version="15.0").n == 40
+
+
+def test_registry_find_invalid_model(synthetic_models_root):
+    path = synthetic_models_root / "enterprise" / "attack-enterprise-16_1.npz"
+    np.savez(path, U=np.ones((3, 4)), V=np.ones((5, 2)), technique_ids=np.array(["T1", "T2"]), hyperparameters=np.array([[0.1, 25, 0.01]]))
+    registry = TIEModelRegistry(synthetic_models_root)
+    with pytest.raises(NotFound):
+        registry.find("enterprise", model_version="16.1")
+    assert registry.find("enterprise").n == 50
+
+
+def top_k_overlap(model_path, technique_sets, limit=20):
+    model64, model32 = ExtractedWalsRecommender(), ExtractedWalsRecommender()
+    model64.load(model_path)
+    model32.load(model_path, dtype=np.float32)
+    assert model32._V.dtype == np.float32
+    assert model32._V.nbytes * 2 == model64._V.nbytes
+    overlaps = []
+    for predictions64, predictions32 in zip(
+        model64.make_batch_predictions(technique_sets, limit=limit),
+        model32.make_batch_predictions(technique_sets, limit=limit),
+    ):
+        overlaps.append(len(dict(predictions64).keys() & dict(predictions32).keys()) / len(predictions64))
+    return np.mean(overlaps), min(overlaps)
+
+
+def test_float32_top_k_overlap(synthetic_model_path):
+    rng = np.random.default_rng(3)
+    technique_sets = [[f"T{1000 + i}" for i in rng.choice(50, size=rng.integers(1, 8), replace=False)] for _ in range(100)]
+    mean_overlap, min_overlap = top_k_overlap(synthetic_model_path, technique_sets, limit=10)
+    assert mean_overlap >= 0.99
+    assert min_overlap >= 0.9
+
+    model32 = ExtractedWalsRecommender()
+    model32.load(synthetic_model_path, dtype=np.float32)
+    entries = np.zeros((model32.n, 2), dtype=np.float32)
+    entries[[0, 1], [0, 1]] = 1
+    assert model32.predict_new_entities(entries, **model32.hyperparameters).dtype == np.float32
+    assert model32.predict_new_entity(entries[:, 0], **model32.hyperparameters).dtype == np.float32
+
+
+SHIPPED_MODEL_PATH = "tie_models/enterprise/attack-enterprise-15_0.npz"
+
+
+@pytest.mark.skipif(not os.path.exists(SHIPPED_MODEL_PATH), reason="TIE model not downloaded")
+def test_float32_top_k_overlap_shipped_model():
+    model = ExtractedWalsRecommender()
+    model.load(SHIPPED_MODEL_PATH)
+    rng = np.random.default_rng(3)
+    technique_sets = [rng.choice(model.all_techniques, size=rng.integers(1, 10), replace=False).tolist() for _ in range(200)]
+    mean_overlap, min_overlap = top_k_overlap(SHIPPED_MODEL_PATH, technique_sets)
+    assert mean_overlap >= 0.99
+    assert min_overlap >= 0.9
+
+
+def test_tie_models(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/models/')
+    assert resp.status_code == 200
+    models = resp.json()
+    assert models
+    assert {model['matrix'] for model in models} == {'enterprise'}
+
+
+def reference_update_factor(V, data, alpha, regularization_coefficient):
+    # the original per-row loop with an explicit inverse, kept to check the vectorized fold-in against
+    p, k = V.shape
+    q = data.shape[1]
+    new_U = np.ndarray((q, k))
+    V_T_V = V.T @ V
+    for i in range(q):
+        P_u = data[:, i]
+        C_u = np.where(P_u > 0, alpha + 1, 1)
+        product = np.zeros((k, k))
+        for j in np.nonzero(C_u - 1)[0]:
+            v_j = np.expand_dims(V[j, :], axis=1)
+            product += v_j @ v_j.T
+        inv = np.linalg.inv(V_T_V + product + regularization_coefficient * np.identity(k))
+        new_U[i, :] = inv @ V.T @ P_u
+    return new_U
+
+
+@pytest.mark.parametrize(
+    ["n", "k", "q", "observed"],
+    [
+        (50, 8, 1, 1),
+        (50, 8, 1, 12),
+        (200, 32, 5, 40),
+        (800, 64, 3, 100),
+    ],
+)
+def test_update_factor_matches_reference(tmp_path, n, k, q, observed):
+    model = ExtractedWalsRecommender()
+    model.load(make_synthetic_model(tmp_path / "model.npz", n=n, k=k))
+    rng = np.random.default_rng(n + k)
+    data = np.zeros((n, q))
+    for i in range(q):
+        data[rng.choice(n, observed, replace=False), i] = 1
+    alpha = 1 / model.hyperparameters["c"] - 1
+    rc = model.hyperparameters["regularization_coefficient"]
+
+    expected = reference_update_factor(model._V, data, alpha, rc)
+    actual = model._update_factor(model._V, data, alpha=alpha, regularization_coefficient=rc)
+    np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-9)
+
+
+def test_batch_predictions_match_single_predictions(synthetic_model_path):
+    model = ExtractedWalsRecommender()
+    model.load(synthetic_model_path)
+    technique_sets = [["T1001"], ["T1002", "T1010", "T1030"], []]
+    batch = model.make_batch_predictions(technique_sets, limit=10)
+    assert len(batch) == len(technique_sets)
+    for techniques, predictions in zip(technique_sets, batch):
+        single = model.make_predictions(techniques, limit=10)
+        assert [t for t, _ in predictions] == [t for t, _ in single]
+        np.testing.assert_allclose([s for _, s in predictions], [s for _, s in single])
+        assert not set(techniques).intersection(t for t, _ in predictions)
+
+
+@pytest.mark.parametrize("limit", [1, 5, 20, 49, 100])
+def test_top_k_matches_full_sort(synthetic_model_path, limit):
+    model = ExtractedWalsRecommender()
+    model.load(synthetic_model_path)
+    techniques = ["T1001", "T1002"]
+    scores = model.predict_new_entities(
+        np.expand_dims(np.isin(model.all_techniques, techniques).astype(float), axis=1),
+        **model.hyperparameters,
+    )[0]
+    expected = [
+        (technique, score)
+        for technique, score in sorted(zip(model.all_techniques.tolist(), scores.tolist()), key=lambda x: x[1], reverse=True)
+        if technique not in techniques
+    ][:limit]
+    assert model.make_predictions(techniques, limit=limit) == expected
+
+
+def test_similar_techniques_matches_cosine(synthetic_model_path):
+    model = ExtractedWalsRecommender()
+    model.load(synthetic_model_path)
+    expected = calculate_predicted_matrix(model._V, model._V, PredictionMethod.COSINE)[3]
+    expected[3] = -np.inf
+    similar = model.similar_techniques("T1003", limit=10)
+    assert [technique for technique, _ in similar] == [f"T{1000 + i}" for i in np.argsort(-expected, kind="stable")[:10]]
+    assert np.allclose([score for _, score in similar], np.sort(expected)[::-1][:10])
+    assert model.similar_techniques("T1003", limit=10) == similar
+
+
+def test_similar_techniques_unknown(synthetic_model_path):
+    model = ExtractedWalsRecommender()
+    model.load(synthetic_model_path)
+    with pytest.raises(NotFound):
+        model.similar_techniques("Tbad01")
+
+
+def test_tie_similar(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/similar/T1548/?limit=5')
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data['scores']) == 5
+    assert 'T1548' not in data['scores']
+    assert all(-1 <= score <= 1 for score in data['scores'].values())
+
+
+def test_tie_similar_unknown(client):
+    resp = client.get('/api/v1/attack-enterprise/tie/similar/Tbad01/')
+    assert resp.status_code == 404
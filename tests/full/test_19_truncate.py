@@ -1,4 +1,6 @@
 import time
+from unittest.mock import patch
+
 import pytest
 
 
@@ -12,3 +14,18 @@ def test_truncate_path(client, path):
     resp2 = client.get(f"/api/v1/{path}/objects/")
     assert resp2.status_code == 200
     assert resp2.data["total_results_count"] == 0
+
+
+def test_truncate_failure_invalidates_caches(client):
+    # the vertex collection is truncated, the edge collection fails
+    with (
+        patch("arango.collection.StandardCollection.truncate", side_effect=[None, Exception("truncate failed")]),
+        patch("ctibutler.server.views.commons.invalidate_version_catalogue") as mock_invalidate,
+        patch("ctibutler.server.views.commons.remove_bundle_memberships") as mock_remove,
+        patch("ctibutler.server.views.commons.vector_search.remove_collections") as mock_remove_vectors,
+    ):
+        resp = client.delete("/api/v1/location/truncate/")
+    assert resp.status_code == 500
+    mock_invalidate.assert_called_once_with("location_vertex_collection")
+    mock_remove.assert_called_once_with("location_vertex_collection", "location_edge_collection")
+    mock_remove_vectors.assert_called_once()
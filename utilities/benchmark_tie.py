@@ -0,0 +1,140 @@
+"""
+Micro-benchmarks for the TIE recommender (`ctibutler/server/tie.py`) on synthetic models.
+
+Runs offline, no ArangoDB/Postgres/Redis is needed. The report is written as JSON so that it can be diffed between releases.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ctibutler.server.tie import ExtractedWalsRecommender, MODEL_ARRAYS
+from utilities.download_tie_models import unpack_model
+
+
+def make_synthetic_model(path: Path, n: int, k: int, m: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    np.savez(
+        path,
+        U=rng.normal(scale=0.1, size=(m, k)),
+        V=rng.normal(scale=0.1, size=(n, k)),
+        technique_ids=np.array([f"T{i:05d}" for i in range(n)]),
+        hyperparameters=np.array([[0.1, 25, 0.01]]),
+    )
+    return path
+
+
+def timeit(func, repeat):
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return dict(
+        repeat=repeat,
+        min_ms=round(float(timings.min()), 4),
+        median_ms=round(float(np.median(timings)), 4),
+        p95_ms=round(float(np.percentile(timings, 95)), 4),
+    )
+
+
+def benchmark_model(workdir: Path, n: int, k: int, args):
+    rng = np.random.default_rng(args.seed)
+    model_path = make_synthetic_model(workdir/f"attack-synthetic-{n}_{k}.npz", n=n, k=k, m=args.entities, seed=args.seed)
+    with contextlib.redirect_stdout(sys.stderr):
+        unpacked_path = unpack_model(model_path, float32=args.float32)
+    dtype = np.float32 if args.float32 else None
+
+    model = ExtractedWalsRecommender()
+    model.load(model_path, dtype=dtype)
+    technique_sets = [
+        rng.choice(model.all_techniques, size=args.techniques_per_set, replace=False).tolist()
+        for _ in range(args.batch_size)
+    ]
+    entries = np.zeros((n, args.batch_size), dtype=model.dtype)
+    for i, techniques in enumerate(technique_sets):
+        entries[[model.technique_ids_to_indices[t] for t in techniques], i] = 1
+    alpha = 1 / model.hyperparameters['c'] - 1
+
+    results = dict(
+        load_npz=timeit(lambda: ExtractedWalsRecommender().load(model_path, dtype=dtype), args.repeat),
+        load_mmap=timeit(lambda: ExtractedWalsRecommender().load(unpacked_path, dtype=dtype), args.repeat),
+        update_factor=timeit(
+            lambda: model._update_factor(model._V, entries[:, :1], alpha, model.hyperparameters['regularization_coefficient']),
+            args.repeat,
+        ),
+        update_factor_batch=timeit(
+            lambda: model._update_factor(model._V, entries, alpha, model.hyperparameters['regularization_coefficient']),
+            args.repeat,
+        ),
+        make_predictions=timeit(lambda: model.make_predictions(technique_sets[0], limit=args.limit), args.repeat),
+        make_batch_predictions=timeit(lambda: model.make_batch_predictions(technique_sets, limit=args.limit), args.repeat),
+        similar_techniques=timeit(lambda: model.similar_techniques(technique_sets[0][0], limit=args.limit), args.repeat),
+    )
+    return dict(
+        n=n,
+        k=k,
+        dtype=str(model.dtype),
+        model_bytes=sum((unpacked_path/f"{key}.npy").stat().st_size for key in MODEL_ARRAYS),
+        results=results,
+    )
+
+
+def parse_sizes(value):
+    return [int(v) for v in value.split(',')]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the TIE recommender on synthetic models.")
+    parser.add_argument('--n', default=[800, 2000, 5000, 10000], type=parse_sizes, help="Comma-separated numbers of techniques (rows of V).")
+    parser.add_argument('--k', default=[10, 64, 256], type=parse_sizes, help="Comma-separated embedding dimensions.")
+    parser.add_argument('--entities', default=100, type=int, help="Number of training entities (rows of U), only affects load time.")
+    parser.add_argument('--batch_size', default=100, type=int, help="Number of technique sets in each batch prediction.")
+    parser.add_argument('--techniques_per_set', default=5, type=int, help="Number of techniques in each technique set.")
+    parser.add_argument('--limit', default=20, type=int, help="Number of predictions returned for each technique set.")
+    parser.add_argument('--repeat', default=10, type=int, help="Number of timed runs of each benchmark.")
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--float32', action='store_true', help="Benchmark the float32 mode (TIE_FLOAT32).")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    report = dict(
+        created=datetime.now(timezone.utc).isoformat(),
+        environment=dict(
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            processor=platform.processor(),
+        ),
+        parameters={key: value for key, value in vars(args).items() if key != 'output'},
+        benchmarks=[],
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for n, k in itertools.product(args.n, args.k):
+            print(f"[TIE benchmark] n={n} k={k}", file=sys.stderr)
+            report['benchmarks'].append(benchmark_model(Path(workdir), n, k, args))
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
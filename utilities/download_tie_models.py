@@ -1,10 +1,21 @@
 import logging
+import os
 from pathlib import Path
+import sys
+import shutil
+import tempfile
+import numpy as np
 import requests
 
 logger = logging.getLogger('TIE Model Downloader')
 
-models_root = Path('tie_models')
+models_root = Path(os.getenv('TIE_MODELS_ROOT', 'tie_models'))
+# store the embeddings unpacked as float32 so that they are still memory-mapped when the API runs with TIE_FLOAT32
+float32 = os.getenv('TIE_FLOAT32', '').lower() in ('1', 'true', 'yes')
+
+DEFAULT_MODELS = [
+    'https://models.ctibutler.com/attack-enterprise-15_0.npz',
+]
 
 def download_model(matrix: str, path: str):
     print(f"[TIE] Downloading Model For {matrix} @ {path}")
@@ -16,8 +27,33 @@ def download_model(matrix: str, path: str):
         with model_path.open('wb') as f:
             for chunk in resp.iter_content(8*1024):
                 f.write(chunk)
+    unpack_model(model_path)
     return
 
+
+def unpack_model(model_path: Path, float32=float32):
+    """
+    Converts a compressed `.npz` model into a directory of raw `.npy` files next to it,
+    this is the format the API memory-maps so that gunicorn workers share the model pages.
+
+    With `float32` (defaults to `TIE_FLOAT32`) U and V are stored as float32.
+    """
+    out_dir = model_path.with_suffix('')
+    print(f"[TIE] Unpacking {model_path} to {out_dir}")
+    tmp_dir = Path(tempfile.mkdtemp(dir=model_path.parent, prefix=f".{out_dir.name}-"))
+    with np.load(model_path) as loaded:
+        for key in loaded.files:
+            array = loaded[key]
+            if float32 and key in ['U', 'V']:
+                array = array.astype(np.float32)
+            np.save(tmp_dir/f"{key}.npy", array)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    tmp_dir.rename(out_dir)
+    return out_dir
+
+
 if __name__ == '__main__':
-    download_model('enterprise', 'https://models.ctibutler.com/attack-enterprise-15_0.npz')
+    # models are named `attack-<matrix>-<version>.npz`, pass extra model urls to install other matrices/versions
+    for url in sys.argv[1:] or DEFAULT_MODELS:
+        download_model(url.split('/')[-1].split('-')[1], url)
     print(f"[TIE] All models downloaded")